@@ -42,8 +42,14 @@ docs_require = [
     'sphinx-copybutton',
 ]
 
+gevent_require = [
+    'gevent>=20.9',
+    'gunicorn>=20.0',
+]
+
 extras_require = {
     'docs': docs_require,
+    'gevent': gevent_require,
     'tests': tests_require,
 }
 
@@ -26,7 +26,7 @@ from unittest.mock import patch
 
 from wlts.utils.schemas import collections_list_response, \
     describe_collection_response, \
-    trajectory_response, root
+    trajectory_response, trajectories_response, root
 from jsonschema import validate
 
 from wlts import create_app
@@ -162,3 +162,60 @@ class TestWLTS:
 
         self._assert_json(response, expected_code=200)
         validate(instance=response.json, schema=trajectory_response)
+
+    def test_trajectory_etag(self, client):
+        url = f'/wlts/trajectory?collections=deter_amz&latitude=-9.091&longitude=-66.031' \
+              f'&access_token={os.getenv("WLTS_TEST_ACCESS_TOKEN")}'
+
+        with patch('wlts.views.WLTS.get_cached_trajectory', return_value=(b'{"query": {}, "result": {}}', 'abc')):
+            response = client.get(url)
+
+            self._assert_json(response, expected_code=200)
+            assert response.headers['ETag'] == '"abc"'
+            assert 'Accept' in response.headers['Vary']
+
+            response = client.get(url, headers={'If-None-Match': '"abc"'})
+
+            assert response.status_code == 304
+
+    def test_trajectory_partial_not_cached(self, client):
+        url = f'/wlts/trajectory?collections=deter_amz&latitude=-9.091&longitude=-66.031' \
+              f'&access_token={os.getenv("WLTS_TEST_ACCESS_TOKEN")}'
+
+        with patch('wlts.views.WLTS.get_cached_trajectory', return_value=(b'{"query": {}, "result": {}}', None)):
+            response = client.get(url, headers={'If-None-Match': '"abc"'})
+
+        self._assert_json(response, expected_code=200)
+        assert 'ETag' not in response.headers
+        assert 'no-store' in response.headers['Cache-Control']
+
+    def test_trajectory_ndjson(self, client):
+        response = client.get(
+            f'/wlts/trajectory?collections=deter_amz&latitude=-9.091&longitude=-66.031'
+            f'&access_token={os.getenv("WLTS_TEST_ACCESS_TOKEN")}',
+            headers={'Accept': 'application/x-ndjson'})
+
+        assert response.status_code == 200
+        assert response.content_type == 'application/x-ndjson'
+
+        dates = [json.loads(line)['date'] for line in response.data.decode('utf-8').splitlines()]
+        assert dates == sorted(dates)
+
+    def test_trajectories_without_points(self, client):
+        response = client.post(
+            f'/wlts/trajectories?access_token={os.getenv("WLTS_TEST_ACCESS_TOKEN")}',
+            json={"collections": "deter_amz"})
+
+        self._assert_json(response, expected_code=400)
+        assert response.json['description'] == "\'points\' is a required property"
+
+    def test_trajectories(self, client):
+        response = client.post(
+            f'/wlts/trajectories?access_token={os.getenv("WLTS_TEST_ACCESS_TOKEN")}',
+            json={"collections": "deter_amz",
+                  "points": [{"longitude": -66.031, "latitude": -9.091},
+                             {"longitude": -54.0, "latitude": -12.0}]})
+
+        self._assert_json(response, expected_code=200)
+        validate(instance=response.json, schema=trajectories_response)
+        assert len(response.json['result']['trajectories']) == 2
@@ -0,0 +1,179 @@
+#
+# This file is part of WLTS.
+# Copyright (C) 2022 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+"""Unit-test for WLTS' controller with stub collections."""
+import json
+import time
+
+import pytest
+from jsonschema import validate
+from werkzeug.exceptions import GatewayTimeout
+
+from wlts.config import Config
+from wlts.controller import WLTS, TrajectoriesParams, TrajectoryParams
+from wlts.datasources.client import DataSourceUnavailable
+from wlts.utils import deadline
+from wlts.utils.schemas import trajectory_response
+
+
+class StubCollection:
+    """A collection with one observation, which may be delayed or fail."""
+
+    def __init__(self, name, delay=0, error=None):
+        self.name = name
+        self.version = 'a'
+        self.delay = delay
+        self.error = error
+        self.remaining = None
+
+    def intersects_period(self, start_date, end_date):
+        return True
+
+    def covers(self, points):
+        return [True for _ in points]
+
+    def trajectory(self, tj_attr, x, y, start_date, end_date, language, geometry):
+        self.remaining = deadline.remaining()
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        tj_attr.append({"class": "Floresta", "collection": self.name, "date": "2020"})
+
+    def trajectories(self, points, start_date, end_date, language, geometry):
+        time.sleep(self.delay)
+        return [[{"class": "Floresta", "collection": self.name, "date": "2020"}] for _ in points]
+
+
+def _params(longitude='-54', **kwargs):
+    return TrajectoryParams(longitude=longitude, latitude='-12', collections='a', **kwargs)
+
+
+def test_trajectory_partial_results():
+    collections = [
+        StubCollection('a'),
+        StubCollection('error', error=Exception('Request Fail: 500 http://internal-host/wfs')),
+        StubCollection('unavailable', error=DataSourceUnavailable('The service http://internal-host is unavailable')),
+        StubCollection('slow', delay=1),
+    ]
+
+    result = WLTS._trajectory(collections, _params(timeout='0.3'))
+
+    validate(instance=result, schema=trajectory_response)
+
+    assert [obs['collection'] for obs in result['result']['trajectory']] == ['a']
+    assert result['incomplete'] is True
+    assert {w['collection']: w['reason'] for w in result['warnings']} == {
+        'error': 'error', 'unavailable': 'unavailable', 'slow': 'timeout'
+    }
+    # The internal hosts of the services are not exposed
+    assert not any('internal-host' in w['description'] for w in result['warnings'])
+
+
+def test_trajectory_deadline():
+    collection = StubCollection('a')
+
+    result = WLTS._trajectory([collection], _params(timeout='5'))
+
+    assert 'warnings' not in result
+    # The budget of the request bounds the HTTP requests of the collection
+    assert 0 < collection.remaining <= 5
+
+
+def test_trajectory_timeout():
+    with pytest.raises(GatewayTimeout):
+        WLTS._trajectory([StubCollection('slow', delay=1)], _params(timeout='0.1'))
+
+
+def test_stream_trajectory(monkeypatch):
+    collections = [StubCollection('slow', delay=0.5), StubCollection('a'), StubCollection('late', delay=2)]
+
+    monkeypatch.setattr(WLTS, '_check_trajectory_request', classmethod(lambda cls, params, roles: collections))
+
+    started_at = time.monotonic()
+    records = WLTS.stream_trajectory(_params(timeout='1'))
+
+    # The observations of a collection are yielded as soon as it finishes
+    assert next(records)['collection'] == 'a'
+    assert time.monotonic() - started_at < 0.4
+
+    assert next(records)['collection'] == 'slow'
+    assert [w['collection'] for w in next(records)['warnings']] == ['late']
+
+
+def test_stream_trajectory_timeout(monkeypatch):
+    monkeypatch.setattr(WLTS, '_check_trajectory_request',
+                        classmethod(lambda cls, params, roles: [StubCollection('slow', delay=1)]))
+
+    assert [record['code'] for record in WLTS.stream_trajectory(_params(timeout='0.1'))] == [504]
+
+
+def test_cached_trajectory(monkeypatch):
+    collection = StubCollection('a')
+    calls = []
+
+    monkeypatch.setattr(WLTS, '_check_trajectory_request', classmethod(lambda cls, params, roles: [collection]))
+    monkeypatch.setattr(collection, 'trajectory',
+                        lambda tj_attr, *args: calls.append(args) or tj_attr.append({"date": "2020"}))
+
+    body, etag = WLTS.get_cached_trajectory(_params(longitude='-54.100000001'))
+    snapped_body, snapped_etag = WLTS.get_cached_trajectory(_params(longitude='-54.1'))
+
+    # The locations are snapped in the cache key, but the query is the one of each request
+    assert len(calls) == 1
+    assert snapped_etag == etag
+    assert json.loads(snapped_body)['query']['longitude'] == -54.1
+    assert json.loads(body)['query']['longitude'] == -54.100000001
+    assert json.loads(snapped_body)['result'] == {"trajectory": [{"date": "2020"}]}
+
+    # A changed collection invalidates its results
+    collection.version = 'b'
+    WLTS.get_cached_trajectory(_params(longitude='-54.1'))
+    assert len(calls) == 2
+
+
+def test_cached_trajectory_partial(monkeypatch):
+    collection = StubCollection('unavailable', error=DataSourceUnavailable('The service is unavailable'))
+
+    monkeypatch.setattr(WLTS, '_check_trajectory_request', classmethod(lambda cls, params, roles: [collection]))
+
+    body, etag = WLTS.get_cached_trajectory(_params(longitude='-55'))
+
+    assert etag is None
+    assert json.loads(body)['incomplete'] is True
+
+    collection.error = None
+    body, etag = WLTS.get_cached_trajectory(_params(longitude='-55'))
+
+    # The partial result was not cached
+    assert etag is not None
+    assert 'warnings' not in json.loads(body)
+
+
+def test_stream_trajectories_chunk_budget(monkeypatch):
+    collection = StubCollection('a', delay=0.2)
+
+    monkeypatch.setattr(WLTS, '_check_trajectories_request', classmethod(lambda cls, params, roles: [collection]))
+    monkeypatch.setattr(Config, 'WLTS_TRAJECTORY_TIMEOUT', 0.5)
+    monkeypatch.setattr(Config, 'WLTS_BATCH_CHUNK_SIZE', 1)
+
+    params = TrajectoriesParams(collections='a', points=[{'longitude': -54, 'latitude': -12} for _ in range(4)])
+
+    # Each chunk has its own budget, so the stream is longer than a single budget
+    records = list(WLTS.stream_trajectories(params))
+
+    assert len(records) == 4
+    assert all(record['trajectory'] for record in records)
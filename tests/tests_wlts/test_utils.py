@@ -18,8 +18,30 @@
 """Unit-test for WLTS' controller."""
 import pytest
 import datetime
+import io
+import threading
+import time
 
-from wlts.utils.utilities import get_date_from_str, transform_crs
+import numpy
+import requests
+from werkzeug.exceptions import NotFound
+
+from wlts.collections import collection as collection_module
+from wlts.collections.collection import ClassificationSystemClass
+from wlts.collections.timeline import TimelineIndex
+from wlts.datasources.capabilities import CapabilitiesCache
+from wlts.datasources.client import HTTPClient
+from wlts.datasources.datasource import DataSource
+from wlts.datasources.wcs import WCS, WCSDataSource
+from wlts.datasources.wfs import WFSDataSource
+from wlts.utils import deadline
+from wlts.utils.breaker import CircuitBreaker
+from wlts.utils.cache import LRUCache, SQLiteCache, size_of
+from wlts.utils.limiter import AdaptiveLimiter
+from wlts.utils.singleflight import SingleFlight
+from wlts.utils.utilities import (get_date_from_str, get_transformer,
+                                  iter_xml_elements, simplify_coordinates,
+                                  transform_crs, transform_geojson)
 
 
 def test_get_date_from_str():
@@ -28,3 +50,550 @@ def test_get_date_from_str():
 
     assert test_date == test_date
     assert isinstance(date, datetime.datetime)
+
+
+def test_lru_cache_evicts_by_size():
+    cache = LRUCache(max_bytes=16)
+    cache.set('a', numpy.zeros(8, dtype='uint8'))
+    cache.set('b', numpy.zeros(8, dtype='uint8'))
+    cache.get('a')
+    cache.set('c', numpy.zeros(8, dtype='uint8'))
+
+    assert cache.get('a') is not None
+    assert cache.get('b') is None
+    assert cache.get('c') is not None
+
+
+def test_size_of():
+    coordinates = [[float(i), float(i)] for i in range(10000)]
+    features = [{'type': 'Feature', 'geometry': {'type': 'LineString', 'coordinates': coordinates}}]
+
+    # The nested coordinates are counted, not only the outer containers
+    assert size_of((features, 4326)) > 10000 * 2 * 8
+    assert size_of(numpy.zeros((32, 32), dtype='uint8')) == 1024
+    assert size_of((b'{}', 'etag')) < 200
+
+
+def test_lru_cache_ttl():
+    cache = LRUCache(max_bytes=1024, ttl=0.01)
+    cache.set('a', 'value')
+
+    assert cache.get('a') == 'value'
+    time.sleep(0.02)
+    assert cache.get('a') is None
+
+
+def test_sqlite_cache(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = SQLiteCache(path, 'tiles', max_bytes=1024 * 1024, ttl=60)
+    cache.set(('image', '2014', 0, 0), numpy.ones((2, 2), dtype='uint8'))
+
+    # Another worker process opens the same database
+    shared = SQLiteCache(path, 'tiles', max_bytes=1024 * 1024, ttl=60)
+
+    assert shared.get(('image', '2014', 0, 0)).sum() == 4
+    assert SQLiteCache(path, 'features', max_bytes=1024).get(('image', '2014', 0, 0)) is None
+
+
+def test_sqlite_cache_private_directory(tmp_path):
+    path = tmp_path / 'wlts'
+    SQLiteCache(str(path / 'cache.sqlite'), 'tiles', max_bytes=1024)
+
+    assert path.stat().st_mode & 0o777 == 0o700
+
+    # A directory writable by others could hold a planted database
+    path.chmod(0o777)
+
+    with pytest.raises(PermissionError):
+        SQLiteCache(str(path / 'cache.sqlite'), 'tiles', max_bytes=1024)
+
+
+def test_sqlite_cache_accessed(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = SQLiteCache(path, 'tiles', max_bytes=3 * 1024)
+
+    for key in 'abc':
+        cache.set(key, b'x' * 900)
+
+    cache._writes = SQLiteCache._EVICTION_INTERVAL - 1
+    cache.get('a')
+
+    # The reads are recorded by the eviction, which keeps the recently read value
+    cache.set('d', b'x' * 900)
+
+    assert cache.get('a') is not None
+    assert cache.get('b') is None
+
+
+def test_transformer_registry():
+    assert get_transformer('EPSG:4674', 'EPSG:4326') is get_transformer('EPSG:4674', 'EPSG:4326')
+    assert get_transformer('EPSG:4674', 'EPSG:4326') is not get_transformer('EPSG:4674', 'EPSG:4326', always_xy=True)
+
+
+def test_transform_geojson():
+    polygon = {'type': 'MultiPolygon', 'coordinates': [[[[-54, -12], [-53.9, -12], [-53.9, -11.9], [-54, -12]]]]}
+    point = {'type': 'Point', 'coordinates': [-54, -12]}
+
+    retval = transform_geojson('EPSG:4674', 'EPSG:4326', [polygon, point], precision=4)
+
+    assert retval[0]['type'] == 'MultiPolygon'
+    assert len(retval[0]['coordinates'][0][0]) == 4
+    assert retval[1] == {'type': 'Point', 'coordinates': [-54.0, -12.0]}
+
+
+def test_simplify_coordinates():
+    coords = numpy.array([[0, 0], [1, 0.001], [2, 0], [3, 1]], dtype='float64')
+
+    assert simplify_coordinates(coords, 0.01).tolist() == [[0, 0], [2, 0], [3, 1]]
+
+
+def test_iter_xml_elements():
+    doc = io.BytesIO(b'<WFS_Capabilities xmlns="http://www.opengis.net/wfs"><Service><Name>WFS</Name></Service>'
+                     b'<FeatureTypeList><FeatureType><Name>ws:a</Name></FeatureType>'
+                     b'<FeatureType><Name>ws:b</Name></FeatureType></FeatureTypeList></WFS_Capabilities>')
+
+    assert list(iter_xml_elements(doc, {'Name': 'FeatureType'})) == [('Name', 'ws:a'), ('Name', 'ws:b')]
+
+
+def test_timeline_index():
+    timeline = TimelineIndex(['2016', '2014', '2015', '2018'])
+
+    assert timeline.select() == ['2014', '2015', '2016', '2018']
+    assert timeline.select('2015', '2017') == ['2015', '2016']
+    assert timeline.select(end_date='2014-06-01') == ['2014']
+
+
+def test_timeline_index_string_format():
+    properties = [{'temporal_property': str(year)} for year in range(2008, 2012)]
+    timeline = TimelineIndex(properties, key=lambda p: p['temporal_property'], string_format='%Y')
+
+    assert [p['temporal_property'] for p in timeline.select('2009-05-01', '2010-02-01')] == ['2009', '2010']
+
+
+def test_single_flight():
+    flights = SingleFlight()
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def fetch(value):
+        calls.append(value)
+        started.set()
+        release.wait(5)
+        return value * 2
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flights.do('key', fetch, 1)))
+    leader.start()
+    started.wait(5)
+
+    waiters = [threading.Thread(target=lambda: results.append(flights.do('key', fetch, 1))) for _ in range(3)]
+    for waiter in waiters:
+        waiter.start()
+
+    time.sleep(0.1)
+    release.set()
+
+    for thread in [leader, *waiters]:
+        thread.join(5)
+
+    assert calls == [1]
+    assert results == [2, 2, 2, 2]
+    assert len(flights) == 0
+
+    with pytest.raises(ValueError):
+        flights.do('error', int, 'x')
+
+    assert flights.do('key', fetch, 2) == 4
+
+
+def test_adaptive_limiter():
+    limiter = AdaptiveLimiter(max_concurrency=4, min_concurrency=1)
+
+    assert limiter.limit == 4
+    assert all(limiter.acquire(0) for _ in range(4))
+    assert not limiter.acquire(0.01)
+
+    started_at = time.monotonic()
+    limiter.release(started_at, failed=True)
+    assert limiter.limit == 2
+
+    # Only one decrease for the calls of the same round
+    limiter.release(started_at, failed=True)
+    assert limiter.limit == 2
+    assert limiter.in_flight == 2
+
+    # The waiting calls are served in arrival order
+    order = []
+    waiters = [threading.Thread(target=lambda i=i: limiter.acquire(5) and order.append(i)) for i in range(2)]
+    for waiter in waiters:
+        waiter.start()
+        time.sleep(0.05)
+
+    for _ in range(2):
+        limiter.release(time.monotonic())
+        time.sleep(0.05)
+
+    for waiter in waiters:
+        waiter.join(5)
+
+    assert order == [0, 1]
+
+    for _ in range(20):
+        limiter.acquire(0)
+        limiter.release(time.monotonic())
+
+    assert limiter.limit == 4
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+
+    assert breaker.allow()
+    breaker.record(failed=True)
+    assert breaker.state == 'closed'
+    breaker.record(failed=True)
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+
+    # A single probe is allowed, a failed probe opens the circuit again
+    assert breaker.state == 'half-open'
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record(failed=True)
+    assert breaker.state == 'open'
+
+    time.sleep(0.06)
+
+    assert breaker.allow()
+    breaker.record(failed=False)
+    assert breaker.state == 'closed'
+    assert breaker.allow() and breaker.allow()
+
+
+def test_deadline():
+    assert deadline.remaining() is None
+
+    at = time.monotonic() + 10
+
+    assert 9 < deadline.run(at, deadline.remaining) <= 10
+    # A nested deadline never extends the current one
+    assert deadline.run(at, deadline.run, at + 10, deadline.current) == at
+    # The deadline is carried to the functions bound to it
+    assert deadline.run(at, deadline.bind, deadline.current)() == at
+    assert deadline.remaining() is None
+
+
+def test_http_client_retries():
+    client = HTTPClient('http://localhost', max_retries=2)
+
+    retry = client._session.get_adapter('http://localhost').max_retries
+
+    assert retry.total == 2
+    # A read timeout is not retried
+    assert retry.read == 0
+
+
+def test_http_client_expired_deadline():
+    client = HTTPClient('http://localhost')
+
+    with pytest.raises(requests.Timeout):
+        deadline.run(time.monotonic() - 1, client._request, 'http://localhost/wfs')
+
+    # A request abandoned by its caller is not a failure of the service
+    assert client._breaker.state == 'closed'
+
+
+def test_http_client_timeout_within_deadline():
+    client = HTTPClient('http://localhost', failure_threshold=2)
+    timeouts = []
+
+    def get(uri, timeout, **kwargs):
+        timeouts.append(timeout)
+        raise requests.ReadTimeout('Read timed out')
+
+    client._session.get = get
+
+    for _ in range(2):
+        with pytest.raises(requests.Timeout):
+            deadline.run(time.monotonic() + 5, client._request, 'http://localhost/wfs')
+
+    # The read timeout is shortened by the deadline, but the service timed out before it expired
+    assert all(read <= 5 for _, read in timeouts)
+    assert client._breaker.state == 'open'
+
+
+def test_http_client_queue_timeout():
+    client = HTTPClient('http://localhost', max_concurrency=1, queue_timeout=0.01, failure_threshold=2)
+
+    # All the slots are held by the calls in progress of a healthy service
+    assert client._limiter.acquire()
+
+    for _ in range(3):
+        with pytest.raises(requests.Timeout):
+            client._request('http://localhost/wfs')
+
+    assert client._breaker.state == 'closed'
+
+
+class _CapabilitiesResponse:
+    def __init__(self, status_code, body=b'', etag=None):
+        self.status_code = status_code
+        self.raw = io.BytesIO(body)
+        self.headers = {'ETag': etag} if etag else {}
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.closed = True
+
+
+class _CapabilitiesClient:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.headers = list()
+
+    def _open(self, url, headers=None):
+        self.headers.append(headers)
+        return self.responses.pop(0)
+
+
+def test_http_client_stream_holds_slot():
+    client = HTTPClient('http://localhost', max_concurrency=1)
+    response = _CapabilitiesResponse(200, b'body')
+
+    client._session.get = lambda uri, timeout, **kwargs: response
+
+    with client._stream('http://localhost/wcs') as body:
+        # The slot is held while the body is read
+        assert client._limiter.in_flight == 1
+        assert body.read() == b'body'
+
+    assert client._limiter.in_flight == 0
+    assert response.closed
+
+    response = _CapabilitiesResponse(200)
+
+    def _read(size=-1):
+        raise requests.ConnectionError('Connection reset by peer')
+
+    response.raw.read = _read
+
+    # A failed transfer of the body is a failure of the service
+    for _ in range(5):
+        with pytest.raises(requests.ConnectionError):
+            with client._stream('http://localhost/wcs') as body:
+                body.read()
+
+    assert client._breaker.state == 'open'
+
+
+def test_capabilities_version():
+    client = _CapabilitiesClient(_CapabilitiesResponse(200, b'a b', etag='"1"'),
+                                 _CapabilitiesResponse(304),
+                                 _CapabilitiesResponse(200, b'a b c', etag='"2"'))
+
+    capabilities = CapabilitiesCache(client, 'http://localhost/wfs', lambda body: body.read().decode().split())
+
+    assert capabilities.version is None
+    assert 'a' in capabilities
+
+    version = capabilities.version
+
+    # An unchanged document keeps the version
+    assert capabilities.refresh() is False
+    assert client.headers[1] == {'If-None-Match': '"1"'}
+    assert capabilities.version == version
+
+    assert capabilities.refresh() is True
+    assert capabilities.names == frozenset(['a', 'b', 'c'])
+    assert capabilities.version != version
+
+    # Another worker which loads the same document has the same version
+    other = CapabilitiesCache(_CapabilitiesClient(_CapabilitiesResponse(200, b'a b c', etag='"2"')),
+                              'http://localhost/wfs', lambda body: body.read().decode().split())
+
+    assert other.names == capabilities.names
+    assert other.version == capabilities.version
+
+
+def test_wfs_check_feature():
+    datasource = WFSDataSource('wfs', {'host': 'http://localhost'})
+
+    client = _CapabilitiesClient(_CapabilitiesResponse(200, b'ws:a ws:b'))
+    datasource._wfs._capabilities = CapabilitiesCache(client, 'http://localhost/wfs',
+                                                      lambda body: body.read().decode().split())
+
+    datasource.check_feature(workspace='ws', ft_name='a')
+
+    with pytest.raises(NotFound):
+        datasource.check_feature(workspace='ws', ft_name='c')
+
+    # The feature types are checked against the names of a single GetCapabilities document
+    assert len(client.headers) == 1
+
+
+def test_datasource_refresh():
+    class _DataSource(DataSource):
+        refreshes = 0
+
+        def get_type(self):
+            return 'stub'
+
+        def refresh(self):
+            self.refreshes += 1
+
+        @property
+        def refresh_interval(self):
+            return 0.01
+
+    datasource = _DataSource('stub')
+    datasource.start()
+
+    assert datasource.wait_ready(1)
+
+    time.sleep(0.1)
+
+    assert datasource.refreshes > 1
+
+
+def test_wcs_describe_image_failure_is_cached(monkeypatch):
+    wcs = WCS('http://localhost')
+    calls = []
+
+    def _stream(url):
+        calls.append(url)
+        raise Exception('Request Fail: 400')
+
+    monkeypatch.setattr(wcs, '_stream', _stream)
+
+    assert wcs.describe_image('coverage') is None
+    assert wcs.describe_image('coverage') is None
+    assert len(calls) == 1
+
+
+def test_wcs_describe_image_transient_failure(monkeypatch):
+    wcs = WCS('http://localhost')
+    calls = []
+
+    def _stream(url):
+        calls.append(url)
+        raise requests.ConnectTimeout('Connection timed out')
+
+    monkeypatch.setattr(wcs, '_stream', _stream)
+
+    # A transient failure is reported to the caller and not remembered
+    for _ in range(2):
+        with pytest.raises(requests.Timeout):
+            wcs.describe_image('coverage')
+
+    assert len(calls) == 2
+
+
+def test_wcs_read_window_failure(monkeypatch):
+    wcs = WCS('http://localhost')
+
+    def get(uri, timeout, **kwargs):
+        raise requests.ConnectionError('Connection refused')
+
+    monkeypatch.setattr(wcs._session, 'get', get)
+
+    # A failed request is reported to the caller, instead of an image without values
+    with pytest.raises(requests.ConnectionError):
+        wcs.read_window('coverage', 4326, 0, 0, 1, 1, 4, 4, '2020')
+
+
+_GRID = dict(min_x=100.0, max_y=50.0, res_x=10.0, res_y=5.0, column=20, row=12)
+
+
+def test_wcs_pixel():
+    assert WCSDataSource._pixel(_GRID, 100.0, 50.0) == (0, 0)
+    assert WCSDataSource._pixel(_GRID, 115.0, 44.0) == (1, 1)
+    assert WCSDataSource._pixel(_GRID, 299.9, -9.9) == (19, 11)
+    assert WCSDataSource._pixel(_GRID, 300.0, 40.0) is None
+    assert WCSDataSource._pixel(_GRID, 150.0, 50.1) is None
+
+
+def test_wcs_sample_windows():
+    datasource = WCSDataSource('wcs', {'host': 'http://localhost', 'sampling_window': 4, 'max_window': 8})
+    windows = []
+
+    def read_window(image, srid, min_x, min_y, max_x, max_y, column, row, time):
+        # Each value is the native (row, column) of the pixel, as row * 1000 + column
+        first_column = round((min_x - _GRID['min_x']) / _GRID['res_x'])
+        first_row = round((_GRID['max_y'] - max_y) / _GRID['res_y'])
+
+        assert round((max_x - min_x) / _GRID['res_x']) == column
+        assert round((max_y - min_y) / _GRID['res_y']) == row
+
+        windows.append((first_column, first_row, column, row))
+
+        rows, columns = numpy.mgrid[first_row:first_row + row, first_column:first_column + column]
+        return rows * 1000 + columns
+
+    datasource._wcs.read_window = read_window
+
+    pixels = [(0, 0), (5, 2), (19, 11), (9, 6)]
+
+    assert datasource._sample('image', 4326, _GRID, '2020', pixels) == [0, 2005, 11019, 6009]
+    # The tiles of a window are clipped to the grid and grouped by max_window
+    assert sorted(windows) == [(0, 0, 8, 4), (8, 4, 4, 4), (16, 8, 4, 4)]
+
+    # The cached tiles answer the pixels without requests
+    assert datasource._sample('image', 4326, _GRID, '2020', [(1, 1), (18, 10)]) == [1001, 10018]
+    assert len(windows) == 3
+
+
+def test_wcs_get_image_cache():
+    datasource = WCSDataSource('wcs', {'host': 'http://localhost'})
+    answers = [None, numpy.uint8(3)]
+    calls = []
+
+    def get_image(*args):
+        calls.append(args)
+        return answers.pop(0)
+
+    datasource._wcs.get_image = get_image
+
+    grid = {'column': 10, 'row': 10}
+
+    # A failed request is not cached, while a value is answered from the tiles cache
+    assert datasource._get_image('ws:image', 4326, grid, '2020', -54, -12) is None
+    assert datasource._get_image('ws:image', 4326, grid, '2020', -54, -12) == 3
+    assert datasource._get_image('ws:image', 4326, grid, '2020', -54, -12) == 3
+    assert len(calls) == 2
+
+
+class _ClassesDataSource:
+    class_cache_ttl = 3600
+
+    def __init__(self):
+        self.bulk_requests = 0
+
+    def get_classes(self, **kwargs):
+        self.bulk_requests += 1
+        raise Exception('Request Fail: 500')
+
+    def get_classe(self, feature_id, **kwargs):
+        return f'class {feature_id}'
+
+
+def test_classification_system_bulk_failure(monkeypatch):
+    datasource = _ClassesDataSource()
+
+    monkeypatch.setattr(collection_module.datasource_manager, 'get_datasource', lambda datasource_id: datasource)
+
+    classification = ClassificationSystemClass(type='Self', datasource_id='ds', property_name='classes',
+                                               class_property_name='name', class_property_value='id',
+                                               class_property_id='id', classification_system_name=None,
+                                               classification_system_title=None, classification_system_id=None,
+                                               classification_system_version=None, workspace='ws')
+
+    # The classes are retrieved one by one, and the bulk request is not tried on every call
+    assert classification.get_class(1) == 'class 1'
+    assert classification.get_class(2) == 'class 2'
+    assert datasource.bulk_requests == 1
@@ -16,8 +16,17 @@
 # along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
 #
 """WLTS Collection Class."""
+import ast
+import time
 from abc import ABCMeta, abstractmethod
+from threading import Event, Lock, Thread
+from typing import List, Optional
 
+import numpy
+from shapely.geometry import Point, shape
+from shapely.prepared import prep
+
+from wlts.config import Config
 from wlts.datasources.ds_manager import datasource_manager
 
 
@@ -25,7 +34,8 @@ class Collection(metaclass=ABCMeta):
     """Abstract class to represent an collection."""
 
     def __init__(self, name, title, authority_name, description, detail, datasource_id, dataset_type,
-                 classification_class, temporal, scala, spatial_extent, period, is_public, deprecated):
+                 classification_class, temporal, scala, spatial_extent, period, is_public, deprecated,
+                 footprint=None):
         """Create Collection."""
         self.name = name
         self.title = title
@@ -43,6 +53,105 @@ class Collection(metaclass=ABCMeta):
 
         self.datasource = datasource_manager.get_datasource(datasource_id)
 
+        # The extent and the (optional) footprint are used to skip the locations outside the collection
+        self._extent = self._create_extent(spatial_extent)
+        self._footprint = prep(shape(footprint)) if footprint else None
+
+        self._loaded = Event()
+        self._error = None
+
+    def validate(self) -> None:
+        """Verify the collection against its datasource, once the datasource is ready.
+
+        Raises an exception when the collection is not valid. By default there is nothing to verify.
+        """
+        pass
+
+    def start(self) -> None:
+        """Validate the collection in a background thread, as soon as its datasource is ready."""
+        thread = Thread(target=self._load, name=f'wlts-collection-{self.name}', daemon=True)
+        thread.start()
+
+    def _load(self) -> None:
+        """Wait the datasource and validate the collection."""
+        self.datasource.wait_ready()
+
+        try:
+            self.validate()
+        except Exception as e:
+            self._error = e
+
+        self._loaded.set()
+
+    @property
+    def is_ready(self) -> bool:
+        """Return whether the collection is validated and ready to serve requests."""
+        return self._loaded.is_set() and self._error is None
+
+    @property
+    def error(self):
+        """Return the validation error of the collection, if any."""
+        return self._error
+
+    def wait_ready(self, timeout: float = None) -> bool:
+        """Wait until the collection is loaded (validated or not).
+
+        Args:
+            timeout (float, optional): The maximum time, in seconds, to wait.
+
+        Returns:
+            bool: Whether the collection is ready.
+        """
+        self._loaded.wait(timeout)
+
+        return self.is_ready
+
+    @staticmethod
+    def _create_extent(spatial_extent):
+        """Return the spatial extent as a (min_x, min_y, max_x, max_y) tuple, or None when it is not given."""
+        if not spatial_extent:
+            return None
+
+        for keys in (('xmin', 'ymin', 'xmax', 'ymax'), ('min_x', 'min_y', 'max_x', 'max_y')):
+            if all(key in spatial_extent for key in keys):
+                return tuple(float(spatial_extent[key]) for key in keys)
+
+        return None
+
+    def covers(self, points: List) -> List[bool]:
+        """Check which locations may have observations in the collection, based on its extent and footprint.
+
+        Args:
+            points (list): A list of (longitude, latitude) tuples according to EPSG:4326.
+
+        Returns:
+            list: For each location, whether it is inside the collection extent (and footprint).
+        """
+        if not points:
+            return []
+
+        coords = numpy.asarray(points, dtype='float64')
+
+        mask = numpy.ones(len(coords), dtype=bool)
+
+        if self._extent is not None:
+            min_x, min_y, max_x, max_y = self._extent
+            mask &= (coords[:, 0] >= min_x) & (coords[:, 0] <= max_x) & \
+                    (coords[:, 1] >= min_y) & (coords[:, 1] <= max_y)
+
+        if self._footprint is not None:
+            for index in numpy.flatnonzero(mask):
+                mask[index] = self._footprint.intersects(Point(coords[index]))
+
+        return mask.tolist()
+
+    def intersects_period(self, start_date, end_date) -> bool:
+        """Check if the collection may have observations in the requested period.
+
+        By default the collection is always queried: the period is filtered by the datasource.
+        """
+        return True
+
     @staticmethod
     def create_classification_system(classification_class):
         """Creates a Classification System for Collection.
@@ -90,6 +199,11 @@ class Collection(metaclass=ABCMeta):
         """Return datasource of the collection."""
         return self.datasource
 
+    @property
+    def version(self) -> Optional[str]:
+        """Return an identifier of the collection content (its datasource capabilities), shared by the workers."""
+        return self.datasource.version
+
     def get_resolution_unit(self):
         """Return the collection resolution unit."""
         return self.temporal["resolution"]["unit"]
@@ -128,6 +242,31 @@ class Collection(metaclass=ABCMeta):
         """
         pass
 
+    def trajectories(self, points, start_date, end_date, language, geometry):
+        """Return the trajectories of a set of locations.
+
+        Collections able to query several locations at once must override this method,
+        by default each location is queried individually.
+
+        Args:
+            points (list): A list of (longitude, latitude) tuples according to EPSG:4326.
+            start_date (:obj:`str`, optional): The begin of a time interval.
+            end_date (:obj:`str`, optional): The begin of a time interval.
+            language (:obj:`str`, optional): The class language support.
+            geometry (:obj:`str`, optional): Used to return geometry in trajectory.
+
+        Returns:
+            list: A list with the trajectory of each location, in the order of ``points``.
+        """
+        result = list()
+
+        for x, y in points:
+            tj_attr = list()
+            self.trajectory(tj_attr, x, y, start_date, end_date, language, geometry)
+            result.append(tj_attr)
+
+        return result
+
     @abstractmethod
     def collection_type(self):
         """Abstract Method to get collections type.
@@ -185,6 +324,11 @@ class ClassificationSystemClass:
 
         self.datasource = datasource_manager.get_datasource(kwargs['datasource_id'])
 
+        self._classes = None
+        self._classes_loaded_at = None
+        self._classes_failed_at = None
+        self._classes_lock = Lock()
+
     @property
     def type(self):
         """Return classification system type based on WLTS model."""
@@ -238,3 +382,87 @@ class ClassificationSystemClass:
     def workspace(self):
         """Return workspace system id."""
         return self._workspace
+
+    def _class_filter(self):
+        """Return the classification system identifier used to filter the classes, if any."""
+        return self._classification_system_id if self._classification_system_name is not None else None
+
+    def _parse_class(self, name):
+        """Return the names of a class, by language."""
+        if self._classification_system_name is None:
+            return {None: name}
+
+        return ast.literal_eval(name)
+
+    def _load_classes(self):
+        """Load (or refresh) the whole class table of the classification system in a single request.
+
+        When the request fails, the table loaded so far is kept (the classes are then retrieved
+        individually) and the request is only tried again after ``WLTS_LOAD_RETRY_INTERVAL`` seconds.
+        """
+        ttl = getattr(self.datasource, 'class_cache_ttl', 86400)
+
+        with self._classes_lock:
+            now = time.monotonic()
+
+            if self._classes_loaded_at is not None and now - self._classes_loaded_at < ttl:
+                return self._classes
+
+            if self._classes_failed_at is not None and now - self._classes_failed_at < Config.WLTS_LOAD_RETRY_INTERVAL:
+                return self._classes
+
+            try:
+                classes = self.datasource.get_classes(ft_name=self._property_name,
+                                                      workspace=self._workspace,
+                                                      value=self._class_property_value,
+                                                      class_property_name=self._class_property_name,
+                                                      classification_system_id=self._class_filter())
+            except Exception:
+                self._classes_failed_at = now
+
+                if self._classes is None:
+                    self._classes = dict()
+
+                return self._classes
+
+            self._classes = {class_id: self._parse_class(name) for class_id, name in classes.items()}
+            self._classes_loaded_at = now
+            self._classes_failed_at = None
+
+            return self._classes
+
+    def get_class(self, class_id, language=None):
+        """Return the name of a class of the classification system.
+
+        The whole class table is loaded once and refreshed after the ``class_cache_ttl``
+        of the datasource. Classes missing from the table are retrieved individually.
+
+        Args:
+            class_id: The class identifier.
+            language (str, optional): The language of the class name.
+
+        Returns:
+            str: The class name in the given language, or in the first available one.
+        """
+        names = self._load_classes().get(str(class_id))
+
+        if names is None:
+            kwargs = dict()
+
+            if self._class_filter() is not None:
+                kwargs['classification_system_id'] = self._class_filter()
+
+            names = self._parse_class(self.datasource.get_classe(feature_id=class_id,
+                                                                 value=self._class_property_value,
+                                                                 class_property_name=self._class_property_name,
+                                                                 ft_name=self._property_name,
+                                                                 workspace=self._workspace,
+                                                                 **kwargs))
+
+            with self._classes_lock:
+                self._classes[str(class_id)] = names
+
+        if language in names:
+            return names[language]
+
+        return names[list(names.keys())[0]]
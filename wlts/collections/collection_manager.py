@@ -72,6 +72,8 @@ class CollectionManager:
     def insert(self, collection_type: str, collection_info: dict)-> None:
         """Method to creates a new collection and stores in list of collections.
 
+        The collection is validated in background, once its datasource is ready.
+
         Args:
             collection_type (str): The collection type to be create.
             collection_info (dict): The collection information.
@@ -79,6 +81,8 @@ class CollectionManager:
         collection = CollectionFactory.make(collection_type, collection_info)
         self._collections[collection.name] = collection
 
+        collection.start()
+
     def collection(self, collection_id: str):
         """Return the collection.
 
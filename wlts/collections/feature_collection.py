@@ -19,6 +19,7 @@
 from typing import Dict, List
 
 from .collection import Collection
+from .timeline import TimelineIndex
 
 
 class FeatureCollection(Collection):
@@ -44,11 +45,54 @@ class FeatureCollection(Collection):
                          collections_info["period"],
                          collections_info["is_public"],
                          collections_info["deprecated"],
+                         collections_info.get("footprint"),
                          )
 
         self.geom_property = collections_info["geom_property"]
         self.observations_properties = collections_info["observations_properties"]
 
+        # The temporal properties of STRING collections are indexed by date, once
+        self._timelines = [self._create_timeline(obs) for obs in self.observations_properties]
+
+    def _create_timeline(self, obs):
+        """Create the timeline index of the temporal properties of an observation, for STRING collections."""
+        if self.temporal["type"] != "STRING":
+            return None
+
+        properties = obs['properties'] if isinstance(obs['properties'], list) else [obs['properties']]
+
+        return TimelineIndex(properties, key=lambda properties: properties['temporal_property'],
+                             string_format=self.temporal["string_format"])
+
+    def intersects_period(self, start_date, end_date) -> bool:
+        """Check if the collection may have observations in the requested period.
+
+        The STRING collections have observations only for their temporal properties.
+        """
+        return any(timeline is None or timeline.select(start_date, end_date) for timeline in self._timelines)
+
+    def _temporal_properties(self, start_date, end_date):
+        """Return the observations and their temporal properties inside the requested period.
+
+        The DATE collections are filtered by the datasource.
+        """
+        for obs, timeline in zip(self.observations_properties, self._timelines):
+            if timeline is None:
+                yield obs, obs['properties']
+                continue
+
+            properties = timeline.select(start_date, end_date)
+
+            if properties:
+                yield obs, properties
+
+    def validate(self) -> None:
+        """Verify if the feature types of the collection exist in the datasource."""
+        ds = self.get_datasource()
+
+        for obs in self.observations_properties:
+            ds.check_feature(workspace=obs["workspace"], ft_name=obs["feature_name"])
+
     def collection_type(self) -> str:
         """Return collection type."""
         return "Feature"
@@ -82,7 +126,7 @@ class FeatureCollection(Collection):
         ds = self.datasource
         result = list()
 
-        for obs in self.observations_properties:
+        for obs, temporal_properties in self._temporal_properties(start_date, end_date):
 
             args = {
                 "temporal": self.temporal,
@@ -98,20 +142,54 @@ class FeatureCollection(Collection):
                 "geometry_flag": geometry
             }
 
-            if isinstance(obs['properties'], list):
-                for temporal_properties in obs['properties']:
-                    args["temporal_properties"] = temporal_properties
-                    trj = ds.get_trajectory(**args)
-                    _prepare_result(result, trj)
-            else:
-                args["temporal_properties"] = obs['properties']
-                trj = ds.get_trajectory(**args)
-                _prepare_result(result, trj)
+            # The temporal properties of a layer are retrieved together
+            args["temporal_properties"] = temporal_properties
+            trj = ds.get_trajectory(**args)
+            _prepare_result(result, trj)
 
         result = [dict(item, collection=self.get_name()) for item in result]
 
         tj_attr.extend(result)
 
+    def trajectories(self, points, start_date, end_date, language, geometry):
+        """Return the trajectories of a set of locations.
+
+        Each layer is queried for groups of locations at once, instead of once per location.
+
+        Args:
+            points (list): A list of (longitude, latitude) tuples according to EPSG:4326.
+            start_date (:obj:`str`, optional): The begin of a time interval.
+            end_date (:obj:`str`, optional): The begin of a time interval.
+            language (:obj:`str`, optional): The class language support.
+            geometry (:obj:`str`, optional): Used to return geometry in trajectory.
+
+        Returns:
+            list: A list with the trajectory of each location, in the order of ``points``.
+        """
+        ds = self.datasource
+        result = [list() for _ in points]
+
+        for obs, temporal_properties in self._temporal_properties(start_date, end_date):
+            args = {
+                "temporal": self.temporal,
+                "feature_name": obs['feature_name'],
+                "workspace": obs['workspace'],
+                "geom_property": self.geom_property,
+                "start_date": start_date,
+                "end_date": end_date,
+                "classification_class": self.classification_class,
+                "language": language,
+                "geometry_flag": geometry
+            }
+
+            # The temporal properties of a layer are retrieved together
+            args["temporal_properties"] = temporal_properties
+
+            for tj_attr, trj in zip(result, ds.get_trajectories(points, **args)):
+                tj_attr.extend(dict(item, collection=self.get_name()) for item in trj)
+
+        return result
+
     def layers_information(self) -> List[Dict]:
         """Return the dataset information of feature collection."""
         layers = list()
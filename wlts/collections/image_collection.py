@@ -18,7 +18,12 @@
 """WLTS Image Collection Class."""
 from typing import Dict, List
 
+from wlts.config import Config
+from wlts.utils import deadline
+from wlts.utils.executors import get_executor
+
 from .collection import Collection
+from .timeline import TimelineIndex
 
 
 class ImageCollection(Collection):
@@ -43,13 +48,23 @@ class ImageCollection(Collection):
                          collections_info["spatial_extent"],
                          collections_info["period"],
                          collections_info["is_public"],
-                         collections_info["deprecated"])
+                         collections_info["deprecated"],
+                         collections_info.get("footprint"))
 
         self.grid = collections_info["grid"]
         self.spatial_ref_system = collections_info["spatial_reference_system"]
         self.observations_properties = collections_info["attributes_properties"]
         self.timeline = collections_info["timeline"]
 
+        # The timeline is parsed and sorted once, to select the entries of a period with a binary search
+        self._timeline = TimelineIndex(self.timeline)
+
+    def intersects_period(self, start_date, end_date) -> bool:
+        """Check if the collection timeline has entries in the requested period."""
+        return len(self._timeline.select(start_date, end_date)) > 0
+
+    def validate(self) -> None:
+        """Verify if the images of the collection exist in the datasource."""
         self.validade_collection()
 
     def validade_collection(self) -> None:
@@ -86,9 +101,11 @@ class ImageCollection(Collection):
         """
         ds = self.get_datasource()
 
-        for time in self.timeline:
+        args_list = list()
+
+        for time in self._timeline.select(start_date, end_date):
             for att in self.observations_properties:
-                args = {
+                args_list.append({
                     "image": att["image"],
                     "temporal": self.temporal,
                     "workspace": att["workspace"],
@@ -102,13 +119,63 @@ class ImageCollection(Collection):
                     "classification_class": self.classification_class,
                     "language": language,
                     "geometry_flag": geometry
-                }
+                })
+
+        # Sample the whole (time, attribute) grid in the shared pool, keeping the timeline order
+        executor = get_executor('images', Config.WLTS_IMAGE_MAX_WORKERS)
+
+        # The deadline of the request is carried to the images pool
+        for result in executor.map(deadline.bind(lambda args: ds.get_trajectory(**args)), args_list):
+            if result is not None:
+                result["collection"] = self.get_name()
+                tj_attr.append(result)
+
+    def trajectories(self, points, start_date, end_date, language, geometry):
+        """Return the trajectories of a set of locations.
+
+        Each image of the timeline is retrieved for groups of locations at once, instead of once per location.
+
+        Args:
+            points (list): A list of (longitude, latitude) tuples according to EPSG:4326.
+            start_date (:obj:`str`, optional): The begin of a time interval.
+            end_date (:obj:`str`, optional): The begin of a time interval.
+            language (:obj:`str`, optional): The class language support.
+            geometry (:obj:`str`, optional): Used to return geometry in trajectory.
+
+        Returns:
+            list: A list with the trajectory of each location, in the order of ``points``.
+        """
+        ds = self.get_datasource()
+
+        args_list = list()
+
+        for time in self._timeline.select(start_date, end_date):
+            for att in self.observations_properties:
+                args_list.append({
+                    "image": att["image"],
+                    "temporal": self.temporal,
+                    "workspace": att["workspace"],
+                    "grid": self.grid,
+                    "srid": self.spatial_ref_system["srid"],
+                    "start_date": start_date,
+                    "end_date": end_date,
+                    "time": time,
+                    "classification_class": self.classification_class,
+                    "language": language,
+                    "geometry_flag": geometry
+                })
+
+        result = [list() for _ in points]
+
+        executor = get_executor('images', Config.WLTS_IMAGE_MAX_WORKERS)
 
-                result = ds.get_trajectory(**args)
+        for observations in executor.map(deadline.bind(lambda args: ds.get_trajectories(points, **args)), args_list):
+            for tj_attr, obs in zip(result, observations):
+                if obs is not None:
+                    obs["collection"] = self.get_name()
+                    tj_attr.append(obs)
 
-                if result is not None:
-                    result["collection"] = self.get_name()
-                    tj_attr.append(result)
+        return result
 
     def layers_information(self) -> List[Dict]:
         """Return the dataset information of image collection."""
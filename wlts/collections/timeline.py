@@ -0,0 +1,75 @@
+#
+# This file is part of WLTS.
+# Copyright (C) 2022 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+"""WLTS Timeline Index."""
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Callable, List
+
+from wlts.utils.utilities import get_date_from_str
+
+
+class TimelineIndex:
+    """A timeline sorted by date, parsed once, which selects the entries of a period with a binary search."""
+
+    def __init__(self, entries: List, key: Callable = None, string_format: str = None):
+        """Create a timeline index.
+
+        Args:
+            entries (list): The timeline entries.
+            key (callable, optional): A function that returns the date (as string) of an entry.
+                Default: the entry itself.
+            string_format (str, optional): The temporal format of the collection. When given, the dates
+                are compared at the resolution of this format (e.g. ``%Y`` compares years).
+        """
+        self._string_format = string_format
+
+        key = key or (lambda entry: entry)
+
+        dated = sorted(((self._date(key(entry)), position, entry) for position, entry in enumerate(entries)),
+                       key=lambda item: item[:2])
+
+        self._dates = [date for date, _, _ in dated]
+        self._entries = [entry for _, _, entry in dated]
+
+    def _date(self, value: str) -> datetime:
+        """Parse a date, truncated to the resolution of the temporal format."""
+        date = get_date_from_str(value)
+
+        if self._string_format:
+            date = datetime.strptime(date.strftime(self._string_format), self._string_format)
+
+        return date
+
+    def select(self, start_date: str = None, end_date: str = None) -> List:
+        """Return the entries inside a period, sorted by date.
+
+        Args:
+            start_date (:obj:`str`, optional): The begin of a time interval.
+            end_date (:obj:`str`, optional): The end of a time interval.
+
+        Returns:
+            list: The entries whose date is inside the period (inclusive).
+        """
+        start = bisect_left(self._dates, self._date(start_date)) if start_date else 0
+        end = bisect_right(self._dates, self._date(end_date)) if end_date else len(self._dates)
+
+        return self._entries[start:end]
+
+    def __len__(self) -> int:
+        """Return the number of entries."""
+        return len(self._entries)
@@ -17,6 +17,7 @@
 #
 """Brazil Data Cube Configuration."""
 import os
+import tempfile
 
 from packaging import version as _version
 
@@ -47,6 +48,23 @@ class Config():
     BDC_AUTH_CLIENT_ID = os.getenv("BDC_AUTH_CLIENT_ID", None)
     BDC_AUTH_ACCESS_TOKEN_URL = os.getenv("BDC_AUTH_ACCESS_TOKEN_URL", None)
 
+    WLTS_MAX_WORKERS = int(os.getenv('WLTS_MAX_WORKERS', 8))
+    WLTS_TRAJECTORY_TIMEOUT = float(os.getenv('WLTS_TRAJECTORY_TIMEOUT', 300))
+    WLTS_IMAGE_MAX_WORKERS = int(os.getenv('WLTS_IMAGE_MAX_WORKERS', 16))
+    WLTS_BATCH_MAX_POINTS = int(os.getenv('WLTS_BATCH_MAX_POINTS', 50000))
+    WLTS_BATCH_CHUNK_SIZE = int(os.getenv('WLTS_BATCH_CHUNK_SIZE', 1000))
+    WLTS_BATCH_TIMEOUT = float(os.getenv('WLTS_BATCH_TIMEOUT', 1800))
+
+    WLTS_READY_TIMEOUT = float(os.getenv('WLTS_READY_TIMEOUT', 10))
+    WLTS_LOAD_RETRY_INTERVAL = float(os.getenv('WLTS_LOAD_RETRY_INTERVAL', 30))
+
+    WLTS_CACHE_BACKEND = os.getenv('WLTS_CACHE_BACKEND', 'memory')
+    WLTS_CACHE_DIR = os.getenv('WLTS_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'wlts'))
+
+    WLTS_RESULT_CACHE_TTL = float(os.getenv('WLTS_RESULT_CACHE_TTL', 300))
+    WLTS_RESULT_CACHE_SIZE = int(os.getenv('WLTS_RESULT_CACHE_SIZE', 64))
+    WLTS_RESULT_PRECISION = int(os.getenv('WLTS_RESULT_PRECISION', 6))
+
 
 class ProductionConfig(Config):
     """Production Mode."""
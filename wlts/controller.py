@@ -16,13 +16,44 @@
 # along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
 #
 """Controllers of Web Land Trajectory Service."""
-from typing import Dict, List
+import hashlib
+import heapq
+import json
+import logging
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from concurrent.futures import as_completed, wait
+from functools import partial
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
 from flask import abort
 from lccs_db.config import Config as Config_db
-from werkzeug.exceptions import Forbidden, NotFound
+from werkzeug.exceptions import (Forbidden, GatewayTimeout, NotFound,
+                                 ServiceUnavailable)
 
 from wlts.collections.collection_manager import collection_manager
+from wlts.config import Config
+from wlts.datasources.client import DataSourceUnavailable
+from wlts.utils import deadline
+from wlts.utils.cache import create_cache
+from wlts.utils.executors import get_executor
+
+logger = logging.getLogger(__name__)
+
+_result_cache = None
+"""The trajectory results cache, created on first use."""
+
+
+def _get_result_cache():
+    """Return the trajectory results cache."""
+    global _result_cache
+
+    if _result_cache is None:
+        _result_cache = create_cache('results', max_bytes=Config.WLTS_RESULT_CACHE_SIZE * 1024 * 1024,
+                                     ttl=Config.WLTS_RESULT_CACHE_TTL)
+
+    return _result_cache
 
 
 class TrajectoryParams:
@@ -43,6 +74,15 @@ class TrajectoryParams:
         self.end_date = properties.get('end_date', None)
         self.geometry = properties.get('geometry', None)
         self.language = properties.get('language', 'pt-br')
+        self._timeout = properties.get('timeout', None)
+
+    @property
+    def timeout(self) -> float:
+        """Return the time budget, in seconds, of the request, limited by ``WLTS_TRAJECTORY_TIMEOUT``."""
+        if self._timeout is None:
+            return Config.WLTS_TRAJECTORY_TIMEOUT
+
+        return min(float(self._timeout), Config.WLTS_TRAJECTORY_TIMEOUT)
 
     def to_dict(self) -> Dict:
         """Export Trajectory params to Python Dictionary."""
@@ -53,6 +93,45 @@ class TrajectoryParams:
         return data
 
 
+class TrajectoriesParams:
+    """Object wrapper for Trajectories (batch) Request Parameters.
+
+    :param properties: trajectories parameter object
+    :type properties:dict
+    """
+
+    def __init__(self, **properties) -> None:
+        """Creates a trajectories parameter object."""
+        self.collections = properties.get('collections', None)
+        if isinstance(self.collections, str):
+            self.collections = self.collections.split(',')
+        self.points = self._get_points(properties.get('points'))
+        self.start_date = properties.get('start_date', None)
+        self.end_date = properties.get('end_date', None)
+        self.geometry = properties.get('geometry', None)
+        self.language = properties.get('language', 'pt-br')
+
+    @staticmethod
+    def _get_points(points) -> List:
+        """Return the locations as a list of (longitude, latitude) tuples.
+
+        The locations are given as a list of ``longitude``/``latitude`` objects or
+        as a GeoJSON FeatureCollection of Point features.
+        """
+        if isinstance(points, dict):
+            return [tuple(float(c) for c in feature['geometry']['coordinates'][:2]) for feature in points['features']]
+
+        return [(float(point['longitude']), float(point['latitude'])) for point in points]
+
+    def to_dict(self) -> Dict:
+        """Export Trajectories params to Python Dictionary, without the locations."""
+        data = {
+            k: v if v is not None else ''
+            for k, v in vars(self).items() if not k.startswith('_') and k != 'points'
+        }
+        return data
+
+
 class WLTS:
     """WLTS Utility."""
 
@@ -65,6 +144,10 @@ class WLTS:
         available_collections = collection_manager.collections()
 
         for collection in available_collections:
+            # Skip the collections that failed the validation
+            if collection.error is not None:
+                continue
+
             if collection.is_public is True or collection.name in roles:
                 collections.append(collection.name)
 
@@ -122,12 +205,17 @@ class WLTS:
 
     @classmethod
     def check_collection(cls, collection: str, roles) -> None:
-        """Utility to check collection existence in memory and permission."""
+        """Utility to check collection existence in memory, permission and readiness.
+
+        A collection which is still loading is waited up to ``WLTS_READY_TIMEOUT`` seconds.
+        """
         available_collection = collection_manager.collection(collection_id=collection)
         if available_collection is None:
             raise NotFound(f"Collection {collection} not found!")
         if available_collection.is_public is False and available_collection.name not in roles:
             raise Forbidden('Forbidden')
+        if not available_collection.wait_ready(Config.WLTS_READY_TIMEOUT):
+            raise ServiceUnavailable(f"Collection {collection} is not available!")
 
     @staticmethod
     def get_collections(names: list):
@@ -135,16 +223,11 @@ class WLTS:
         return collection_manager.find_collections(names)
 
     @classmethod
-    def get_trajectory(cls, ts_params: TrajectoryParams, roles=None) -> dict:
-        """
-        Retrieves trajectory object.
-
-        :param ts_params: WLTS Request trajectory parameters
-        :type ts_params: TrajectoryParams
-
-        :returns: Trajectory.
-        :rtype: dict
+    def _check_trajectory_request(cls, ts_params, roles=None) -> List:
+        """Validate the collections and language of a trajectory request.
 
+        :returns: The requested collections.
+        :rtype: list
         """
         if not roles:
             roles = []
@@ -161,17 +244,398 @@ class WLTS:
         if ts_params.language not in support_language:
             abort(403, 'Language not supported!')
 
-        tj_attr = []
+        return collections
+
+    @staticmethod
+    def _prune_collections(collections, ts_params, points: List) -> List:
+        """Return the collections that may have observations of the locations in the requested period.
+
+        :returns: The collections and, for each one, the indexes of the locations inside its extent.
+        :rtype: list
+        """
+        pruned = list()
 
         for collection in collections:
-            collection.trajectory(tj_attr, ts_params.longitude, ts_params.latitude, ts_params.start_date,
-                                  ts_params.end_date, ts_params.language, ts_params.geometry)
+            if not collection.intersects_period(ts_params.start_date, ts_params.end_date):
+                continue
+
+            indexes = [index for index, covered in enumerate(collection.covers(points)) if covered]
+
+            if indexes:
+                pruned.append((collection, indexes))
+
+        return pruned
+
+    @staticmethod
+    def _collection_trajectory(collection, ts_params: TrajectoryParams) -> List:
+        """Retrieves the trajectory observations of a single collection, sorted by date."""
+        tj_attr = []
+
+        collection.trajectory(tj_attr, ts_params.longitude, ts_params.latitude, ts_params.start_date,
+                              ts_params.end_date, ts_params.language, ts_params.geometry)
+
+        return sorted(tj_attr, key=lambda k: k['date'])
+
+    @staticmethod
+    def _submit(tasks: List[Callable], timeout: float) -> List[Future]:
+        """Submit the tasks to the collections worker pool.
+
+        The HTTP requests of the tasks are bounded by the time budget, so a task that misses it
+        ends quickly instead of holding a worker of the shared pool.
+        """
+        executor = get_executor('collections', Config.WLTS_MAX_WORKERS)
+
+        at = time.monotonic() + timeout
+
+        return [executor.submit(deadline.run, at, task) for task in tasks]
+
+    @classmethod
+    def _results(cls, futures: List[Future], timeout: float, collections: List, warnings: List) -> List:
+        """Wait the tasks and return their results, in the order they were submitted.
+
+        The tasks share the time budget of the request: the results of the tasks finished within
+        the timeout are returned, while a task that misses it, whose datasource is unavailable
+        (its circuit breaker is open) or that fails gives ``None`` and its collection is reported
+        in ``warnings``.
+
+        :raises GatewayTimeout: When none of the tasks finishes within the timeout.
+        """
+        done, not_done = wait(futures, timeout=timeout)
+
+        for future in not_done:
+            future.cancel()
+
+        if not_done and not done:
+            raise GatewayTimeout('Trajectory request exceeded the time limit')
+
+        results = list()
+
+        for future, collection in zip(futures, collections):
+            if future in not_done:
+                warnings.append(cls._expired(collection))
+                results.append(None)
+                continue
+
+            try:
+                results.append(future.result())
+            except Exception as e:
+                warnings.append(cls._failure(collection, e))
+                results.append(None)
+
+        return results
+
+    @staticmethod
+    def _expired(collection) -> dict:
+        """Return the warning of a collection whose task missed the time budget of the request."""
+        return {"collection": collection.name, "reason": "timeout",
+                "description": "The collection exceeded the time limit of the request"}
+
+    @staticmethod
+    def _failure(collection, error: Exception) -> dict:
+        """Return the warning of a collection whose task failed.
+
+        The error may reveal the internal hosts and URLs of the services, so it is only logged and
+        the warning has a fixed description.
+        """
+        logger.warning('The trajectory of the collection %s failed: %s', collection.name, error, exc_info=error)
+
+        if isinstance(error, DataSourceUnavailable):
+            return {"collection": collection.name, "reason": "unavailable",
+                    "description": "The datasource of the collection is unavailable"}
+
+        return {"collection": collection.name, "reason": "error",
+                "description": "The datasource of the collection failed to answer"}
+
+    @classmethod
+    def get_trajectory(cls, ts_params: TrajectoryParams, roles=None) -> dict:
+        """
+        Retrieves trajectory object.
+
+        :param ts_params: WLTS Request trajectory parameters
+        :type ts_params: TrajectoryParams
+
+        :returns: Trajectory.
+        :rtype: dict
+
+        """
+        collections = cls._check_trajectory_request(ts_params, roles)
+
+        return cls._trajectory(collections, ts_params)
+
+    @classmethod
+    def _trajectory(cls, collections, ts_params: TrajectoryParams) -> dict:
+        """Retrieves the trajectory object of the validated collections.
+
+        The collections that could not be queried within the time budget of the request are
+        reported in ``warnings`` and the response is flagged as ``incomplete``.
+        """
+        pruned = cls._prune_collections(collections, ts_params, [(ts_params.longitude, ts_params.latitude)])
+
+        # Query all collections at the same time, bounded by the collections worker pool
+        futures = cls._submit([partial(cls._collection_trajectory, collection, ts_params)
+                               for collection, _ in pruned], ts_params.timeout)
 
-        trajectory_result = sorted(tj_attr, key=lambda k: k['date'])
+        warnings = list()
 
-        return {
+        results = cls._results(futures, ts_params.timeout, [c for c, _ in pruned], warnings)
+
+        trajectory_result = list(heapq.merge(*[r for r in results if r is not None], key=lambda k: k['date']))
+
+        response = {
             "query": ts_params.to_dict(),
             "result": {
                 "trajectory": trajectory_result
             }
         }
+
+        if warnings:
+            response["incomplete"] = True
+            response["warnings"] = warnings
+
+        return response
+
+    @staticmethod
+    def _trajectory_key(collections, ts_params: TrajectoryParams, roles) -> Tuple:
+        """Return the results cache key of a trajectory request.
+
+        The location is snapped to ``WLTS_RESULT_PRECISION`` decimal places. The key includes the
+        version of each collection, so the results are invalidated when a collection changes. The
+        version is the same in every worker, so the key is valid in a cache shared by the workers.
+        """
+        precision = Config.WLTS_RESULT_PRECISION
+
+        return (
+            tuple(sorted((collection.name, collection.version) for collection in collections)),
+            round(ts_params.longitude, precision),
+            round(ts_params.latitude, precision),
+            ts_params.start_date,
+            ts_params.end_date,
+            ts_params.language,
+            ts_params.geometry,
+            tuple(sorted(roles or [])),
+        )
+
+    @classmethod
+    def get_cached_trajectory(cls, ts_params: TrajectoryParams, roles=None) -> Tuple[bytes, Optional[str]]:
+        """
+        Retrieves the encoded trajectory object and its entity tag, using the results cache.
+
+        The request is validated before the cache is looked up. The cache is disabled when
+        ``WLTS_RESULT_CACHE_TTL`` is ``0``. Only the ``result`` is cached and tagged, the ``query``
+        is encoded for each request. The partial results (with ``warnings``) are neither cached nor tagged.
+
+        :param ts_params: WLTS Request trajectory parameters
+        :type ts_params: TrajectoryParams
+
+        :returns: Trajectory encoded as JSON and its entity tag (None for partial results).
+        :rtype: tuple
+
+        """
+        collections = cls._check_trajectory_request(ts_params, roles)
+
+        enabled = Config.WLTS_RESULT_CACHE_TTL > 0
+
+        key = cls._trajectory_key(collections, ts_params, roles)
+
+        cached = _get_result_cache().get(key) if enabled else None
+
+        if cached is None:
+            response = cls._trajectory(collections, ts_params)
+
+            if "warnings" in response:
+                return cls._encode(response), None
+
+            result = cls._encode(response["result"])
+            cached = (result, hashlib.sha1(result).hexdigest())
+
+            if enabled:
+                _get_result_cache().set(key, cached)
+
+        result, etag = cached
+
+        # The same layout as the encoding of the whole response, with sorted keys
+        return b'{"query": ' + cls._encode(ts_params.to_dict()) + b', "result": ' + result + b'}', etag
+
+    @staticmethod
+    def _encode(value) -> bytes:
+        """Encode a value as JSON."""
+        return json.dumps(value, sort_keys=True, default=str).encode('utf-8')
+
+    @classmethod
+    def stream_trajectory(cls, ts_params: TrajectoryParams, roles=None) -> Iterator[dict]:
+        """
+        Retrieves the trajectory observations as a stream.
+
+        The request is validated and the collections are queried before the stream starts. The
+        observations of each collection, sorted by date, are yielded as soon as the collection
+        finishes, so the stream is ordered by date within each collection only. A request where
+        no collection finishes within the time limit ends the stream with an error record, and the
+        collections that could not be queried are reported in a final ``warnings`` record.
+
+        :param ts_params: WLTS Request trajectory parameters
+        :type ts_params: TrajectoryParams
+
+        :returns: The trajectory observations of each collection, ordered by date.
+        :rtype: Iterator[dict]
+
+        """
+        collections = cls._check_trajectory_request(ts_params, roles)
+
+        pruned = cls._prune_collections(collections, ts_params, [(ts_params.longitude, ts_params.latitude)])
+
+        expires_at = time.monotonic() + ts_params.timeout
+
+        futures = cls._submit([partial(cls._collection_trajectory, collection, ts_params)
+                               for collection, _ in pruned], ts_params.timeout)
+
+        collection_of = {future: collection for future, (collection, _) in zip(futures, pruned)}
+
+        def _generate():
+            warnings = list()
+            finished = 0
+
+            try:
+                for future in as_completed(futures, timeout=max(0, expires_at - time.monotonic())):
+                    finished += 1
+
+                    try:
+                        records = future.result()
+                    except Exception as e:
+                        warnings.append(cls._failure(collection_of[future], e))
+                        continue
+
+                    yield from records
+            except FuturesTimeoutError:
+                if not finished:
+                    for future in futures:
+                        future.cancel()
+
+                    error = GatewayTimeout('Trajectory request exceeded the time limit')
+                    yield {'code': error.code, 'description': error.description}
+                    return
+
+                for future in futures:
+                    if not future.done():
+                        future.cancel()
+                        warnings.append(cls._expired(collection_of[future]))
+
+            if warnings:
+                yield {'incomplete': True, 'warnings': warnings}
+
+        return _generate()
+
+    @classmethod
+    def _collections_trajectories(cls, collections, ts_params: TrajectoriesParams, points: List,
+                                  timeout: float, warnings: List) -> List[dict]:
+        """Retrieves the date-sorted trajectory of each location from all collections.
+
+        Each collection is queried only for the locations inside its extent. The collections
+        that could not be queried are reported in ``warnings``.
+        """
+        pruned = cls._prune_collections(collections, ts_params, points)
+
+        futures = cls._submit([
+            partial(collection.trajectories, [points[index] for index in indexes], ts_params.start_date,
+                    ts_params.end_date, ts_params.language, ts_params.geometry)
+            for collection, indexes in pruned
+        ], timeout)
+
+        trajectories = [list() for _ in points]
+
+        results = cls._results(futures, timeout, [c for c, _ in pruned], warnings)
+
+        for (_, indexes), result in zip(pruned, results):
+            if result is None:
+                continue
+
+            for index, trj in zip(indexes, result):
+                trajectories[index].extend(trj)
+
+        return [
+            {
+                "longitude": x,
+                "latitude": y,
+                "trajectory": sorted(tj_attr, key=lambda k: k['date'])
+            }
+            for (x, y), tj_attr in zip(points, trajectories)
+        ]
+
+    @classmethod
+    def _check_trajectories_request(cls, ts_params: TrajectoriesParams, roles=None) -> List:
+        """Validate the locations, collections and language of a trajectories request."""
+        if len(ts_params.points) > Config.WLTS_BATCH_MAX_POINTS:
+            abort(400, f'The number of points exceeds the limit of {Config.WLTS_BATCH_MAX_POINTS}')
+
+        return cls._check_trajectory_request(ts_params, roles)
+
+    @classmethod
+    def get_trajectories(cls, ts_params: TrajectoriesParams, roles=None) -> dict:
+        """
+        Retrieves the trajectories of a set of locations.
+
+        All the locations share the ``WLTS_BATCH_TIMEOUT`` budget: a collection that does not finish
+        within it is left out of every trajectory and reported in ``warnings``. Large batches should
+        be streamed (see ``stream_trajectories``), which gives each chunk its own budget.
+
+        :param ts_params: WLTS Request trajectories parameters
+        :type ts_params: TrajectoriesParams
+
+        :returns: Trajectories.
+        :rtype: dict
+
+        """
+        collections = cls._check_trajectories_request(ts_params, roles)
+
+        warnings = list()
+
+        response = {
+            "query": ts_params.to_dict(),
+            "result": {
+                "trajectories": cls._collections_trajectories(collections, ts_params, ts_params.points,
+                                                              Config.WLTS_BATCH_TIMEOUT, warnings)
+            }
+        }
+
+        if warnings:
+            response["incomplete"] = True
+            response["warnings"] = warnings
+
+        return response
+
+    @classmethod
+    def stream_trajectories(cls, ts_params: TrajectoriesParams, roles=None) -> Iterator[dict]:
+        """
+        Retrieves the trajectories of a set of locations as a stream.
+
+        The locations are processed in chunks of ``WLTS_BATCH_CHUNK_SIZE``, so only one chunk
+        is held in memory while the stream is consumed. Each chunk has its own budget of
+        ``WLTS_TRAJECTORY_TIMEOUT`` seconds, so the length of the stream is not limited. A chunk where
+        no collection finishes within its budget ends the stream with an error record, and the
+        collections that could not be queried are reported in a final ``warnings`` record.
+
+        :param ts_params: WLTS Request trajectories parameters
+        :type ts_params: TrajectoriesParams
+
+        :returns: The trajectory of each location.
+        :rtype: Iterator[dict]
+
+        """
+        collections = cls._check_trajectories_request(ts_params, roles)
+
+        def _generate():
+            warnings = list()
+
+            for offset in range(0, len(ts_params.points), Config.WLTS_BATCH_CHUNK_SIZE):
+                points = ts_params.points[offset:offset + Config.WLTS_BATCH_CHUNK_SIZE]
+                try:
+                    yield from cls._collections_trajectories(collections, ts_params, points,
+                                                             Config.WLTS_TRAJECTORY_TIMEOUT, warnings)
+                except GatewayTimeout as e:
+                    yield {'code': e.code, 'description': e.description}
+                    return
+
+            if warnings:
+                # A collection is reported once, even if it failed in several chunks
+                yield {'incomplete': True, 'warnings': list({w['collection']: w for w in warnings}.values())}
+
+        return _generate()
@@ -0,0 +1,135 @@
+#
+# This file is part of WLTS.
+# Copyright (C) 2022 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+"""WLTS Capabilities Cache of OGC Web Services."""
+import hashlib
+import time
+from threading import Lock
+from typing import Callable, FrozenSet, Iterable, Optional
+
+
+class CapabilitiesCache:
+    """The names of the layers (feature types or coverages) advertised by the GetCapabilities of a service.
+
+    The document is downloaded on first use and then every ``refresh_interval`` seconds by the
+    background thread of the datasource (see ``DataSource.start``), with a conditional request
+    (``If-None-Match``/``If-Modified-Since``), so an unchanged document costs a ``304 Not Modified``.
+    The membership checks are set lookups.
+    """
+
+    def __init__(self, client, url: str, parser: Callable[..., Iterable[str]], refresh_interval: float = 3600):
+        """Create a capabilities cache.
+
+        Args:
+            client (wlts.datasources.client.HTTPClient): The client of the service.
+            url (str): The GetCapabilities URL.
+            parser (callable): A function that returns the layer names of a GetCapabilities document
+                (a file-like object).
+            refresh_interval (float): The time, in seconds, the document is considered fresh.
+        """
+        self._client = client
+        self._url = url
+        self._parser = parser
+        self._refresh_interval = float(refresh_interval)
+
+        self._names = frozenset()
+        self._etag = None
+        self._last_modified = None
+        self._loaded_at = None
+        self._version = None
+
+        self._lock = Lock()
+
+    def refresh(self) -> bool:
+        """Download the GetCapabilities document again, if it has changed.
+
+        Returns:
+            bool: Whether the layer names changed.
+        """
+        with self._lock:
+            headers = dict()
+
+            if self._loaded_at is not None:
+                if self._etag:
+                    headers['If-None-Match'] = self._etag
+                if self._last_modified:
+                    headers['If-Modified-Since'] = self._last_modified
+
+            with self._client._open(self._url, headers=headers) as response:
+                if response.status_code == 304:
+                    self._loaded_at = time.monotonic()
+                    return False
+
+                if response.status_code != 200:
+                    raise Exception(f"Request Fail: {response.status_code}")
+
+                response.raw.decode_content = True
+
+                digest = hashlib.sha1()
+
+                names = frozenset(self._parser(_DigestReader(response.raw, digest)))
+
+            changed = names != self._names
+
+            self._version = digest.hexdigest()
+            self._names = names
+            self._etag = response.headers.get('ETag')
+            self._last_modified = response.headers.get('Last-Modified')
+            self._loaded_at = time.monotonic()
+
+            return changed
+
+    @property
+    def refresh_interval(self) -> float:
+        """Return the time, in seconds, between the refreshes of the document."""
+        return self._refresh_interval
+
+    @property
+    def names(self) -> FrozenSet[str]:
+        """Return the layer names, loading the document on first use."""
+        if self._loaded_at is None:
+            self.refresh()
+
+        return self._names
+
+    @property
+    def version(self) -> Optional[str]:
+        """Return the digest of the GetCapabilities document, or None before it is loaded.
+
+        It is the same in all the worker processes (and across restarts) for the same document,
+        so it can identify what was derived from the document in a shared cache.
+        """
+        return self._version
+
+    def __contains__(self, name: str) -> bool:
+        """Check whether the service advertises the layer."""
+        return name in self.names
+
+
+class _DigestReader:
+    """A file-like object that updates a digest with the data read from another one."""
+
+    def __init__(self, source, digest):
+        """Create a reader of ``source`` which updates ``digest``."""
+        self._source = source
+        self._digest = digest
+
+    def read(self, size: int = -1) -> bytes:
+        """Read and digest up to ``size`` bytes."""
+        data = self._source.read(size)
+        self._digest.update(data)
+        return data
@@ -0,0 +1,290 @@
+#
+# This file is part of WLTS.
+# Copyright (C) 2022 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+"""WLTS HTTP Client for OGC Web Services."""
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from wlts.utils import deadline
+from wlts.utils.breaker import CircuitBreaker
+from wlts.utils.limiter import AdaptiveLimiter
+from wlts.utils.singleflight import SingleFlight
+
+SESSION_OPTIONS = ('pool_size', 'max_retries', 'backoff_factor', 'timeout', 'capabilities_refresh',
+                   'max_concurrency', 'min_concurrency', 'latency_tolerance', 'queue_timeout',
+                   'failure_threshold', 'reset_timeout')
+"""The datasource information keys used to configure the HTTP client."""
+
+
+def session_options(ds_info: dict) -> dict:
+    """Return the HTTP session options of a datasource information."""
+    return {k: ds_info[k] for k in SESSION_OPTIONS if k in ds_info}
+
+
+class DataSourceUnavailable(requests.ConnectionError):
+    """The service is not requested because its circuit breaker is open."""
+
+
+class HTTPClient:
+    """Base class of the OGC Web Services clients.
+
+    Each client owns a persistent HTTP session, so the connections to the host are kept
+    alive and reused by all the requests (and threads) of the worker. The identical requests
+    issued at the same time are coalesced in a single upstream request (see ``_flights``), and
+    the number of concurrent requests to the host is adapted to its health (see ``_limiter``).
+    After repeated failures the requests fail fast until the host recovers (see ``_breaker``).
+    """
+
+    def __init__(self, host, **kwargs):
+        """Create a HTTP client attached to the given host address (an URL).
+
+        Args:
+            host (str): the server URL.
+            **kwargs: The keyword arguments:
+                auth (tuple): The credentials ("user", "pass") to access the service.
+                pool_size (int): Number of connections kept alive with the host. Default: 20.
+                max_retries (int): Number of retries of a connection error or 502/503/504 answer. Default: 3.
+                backoff_factor (float): Backoff factor, in seconds, between retries. Default: 0.5.
+                timeout (dict/float): The ``connect`` and ``read`` timeouts, in seconds. Default: 10 and 60.
+                capabilities_refresh (float): Time, in seconds, the capabilities are cached. Default: 3600.
+                max_concurrency (int): Maximum number of concurrent requests to the host. Default: 16.
+                min_concurrency (int): Minimum number of concurrent requests to the host. Default: 1.
+                latency_tolerance (float): Latency increase that reduces the concurrency. Default: 2.0.
+                queue_timeout (float): Time, in seconds, a request waits for a free slot. Default: 30.
+                failure_threshold (int): Number of consecutive failures that opens the circuit. Default: 5.
+                reset_timeout (float): Time, in seconds, the circuit stays open before a probe. Default: 30.
+        """
+        invalid_parameters = set(kwargs) - {"auth", *SESSION_OPTIONS}
+
+        if invalid_parameters:
+            raise AttributeError(f'invalid parameter(s): {invalid_parameters}')
+
+        self._host = host
+
+        self._auth = None
+
+        if 'auth' in kwargs:
+            if kwargs['auth'] is not None:
+                if not type(kwargs['auth']) is tuple:
+                    raise AttributeError('auth must be a tuple ("user", "pass")')
+                if len(kwargs['auth']) != 2:
+                    raise AttributeError('auth must be a tuple with 2 values ("user", "pass")')
+                self._auth = kwargs['auth']
+
+        timeout = kwargs.get('timeout', dict())
+
+        if isinstance(timeout, dict):
+            self._timeout = (float(timeout.get('connect', 10)), float(timeout.get('read', 60)))
+        else:
+            self._timeout = float(timeout)
+
+        self._capabilities_refresh = float(kwargs.get('capabilities_refresh', 3600))
+        self._capabilities = None
+
+        self._session = self._create_session(int(kwargs.get('pool_size', 20)),
+                                             int(kwargs.get('max_retries', 3)),
+                                             float(kwargs.get('backoff_factor', 0.5)))
+
+        # The concurrent identical calls share one upstream request
+        self._flights = SingleFlight()
+
+        self._limiter = AdaptiveLimiter(int(kwargs.get('max_concurrency', 16)),
+                                        int(kwargs.get('min_concurrency', 1)),
+                                        float(kwargs.get('latency_tolerance', 2.0)))
+        self._queue_timeout = float(kwargs.get('queue_timeout', 30))
+
+        self._breaker = CircuitBreaker(int(kwargs.get('failure_threshold', 5)),
+                                       float(kwargs.get('reset_timeout', 30)))
+
+    def _create_session(self, pool_size, max_retries, backoff_factor) -> requests.Session:
+        """Create the HTTP session with a connection pool and retries with backoff.
+
+        Only the connection errors and the 502, 503 and 504 answers are retried. A read timeout is
+        not, so a hung service fails after a single read timeout instead of one per attempt.
+        """
+        retry = Retry(total=max_retries, read=0, backoff_factor=backoff_factor,
+                      status_forcelist=(502, 503, 504), raise_on_status=False)
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.auth = self._auth
+        # The responses are transparently decompressed by requests
+        session.headers['Accept-Encoding'] = 'gzip, deflate'
+
+        return session
+
+    @property
+    def host_information(self) -> str:
+        """Returns the host."""
+        return self._host
+
+    @property
+    def capabilities_version(self) -> Optional[str]:
+        """Return the version of the service capabilities (see ``CapabilitiesCache.version``)."""
+        return self._capabilities.version if self._capabilities is not None else None
+
+    @property
+    def capabilities_refresh(self) -> float:
+        """Return the time, in seconds, between the refreshes of the service capabilities."""
+        return self._capabilities_refresh
+
+    def load_capabilities(self) -> None:
+        """Download the GetCapabilities document again, if it has changed."""
+        if self._capabilities is not None:
+            self._capabilities.refresh()
+
+    def _acquire(self):
+        """Wait for a slot of the concurrency limiter of the host and return the timeout of the request.
+
+        The wait and the timeout are bounded by the deadline of the calling thread (see
+        ``wlts.utils.deadline``), so an abandoned call does not keep waiting the service.
+
+        Raises:
+            DataSourceUnavailable: When the circuit breaker of the host is open.
+            requests.Timeout: When no slot is available after ``queue_timeout`` seconds or the deadline expired.
+        """
+        remaining = deadline.remaining()
+
+        if remaining is not None and remaining <= 0:
+            raise requests.Timeout('The deadline of the request expired')
+
+        if not self._breaker.allow():
+            raise DataSourceUnavailable(f'The service {self._host} is unavailable')
+
+        queue_timeout = self._queue_timeout if remaining is None else min(self._queue_timeout, remaining)
+
+        if not self._limiter.acquire(queue_timeout):
+            # The wait for a slot is a saturation of the worker, not a failure of the service
+            self._breaker.record(None)
+            raise requests.Timeout(f'No free connection slot to {self._host} after {queue_timeout:.1f}s')
+
+        timeout = self._timeout
+        remaining = deadline.remaining()
+
+        if remaining is not None:
+            remaining = max(remaining, 0.001)
+            timeout = tuple(min(t, remaining) for t in timeout) if isinstance(timeout, tuple) else \
+                min(timeout, remaining)
+
+        return timeout
+
+    def _release(self, started_at: float, failed: Optional[bool]) -> None:
+        """Release the slot of a request and record its outcome (see ``AdaptiveLimiter.release``)."""
+        self._limiter.release(started_at, failed)
+        self._breaker.record(failed)
+
+    def _request(self, uri, **kwargs) -> requests.Response:
+        """Query the service using HTTP GET verb.
+
+        The request holds a slot of the concurrency limiter of the host (see ``_acquire``) until the
+        response body is received. Server errors (5xx) and failed requests reduce the limit and, when
+        repeated, open the circuit breaker of the host. A call that times out once the deadline of its
+        caller has expired is not a failure of the service.
+
+        The streamed responses must be requested with ``_open``, which holds the slot while the body is read.
+
+        Args:
+            uri (str): URL for the service.
+            **kwargs: Optional arguments to ``requests.Session.get``.
+
+        Raises:
+            DataSourceUnavailable: When the circuit breaker of the host is open.
+            requests.Timeout: When no slot is available after ``queue_timeout`` seconds or the deadline expired.
+        """
+        timeout = self._acquire()
+
+        started_at = time.monotonic()
+        failed = True
+
+        try:
+            response = self._session.get(uri, timeout=timeout, **kwargs)
+            failed = response.status_code >= 500
+            return response
+        except requests.Timeout:
+            # Only the call cut by the expired deadline of its caller says nothing about the service
+            if self._abandoned():
+                failed = None
+            raise
+        finally:
+            self._release(started_at, failed)
+
+    @contextmanager
+    def _open(self, uri, **kwargs):
+        """Query the service using HTTP GET verb and give the response, whose body is streamed.
+
+        The slot of the concurrency limiter is held until the context exits, so the body is read within
+        the limit of concurrent requests to the host. The response is closed when the context exits. The
+        errors of the transfer count as failures of the service, unlike the errors raised by the caller.
+
+        Args:
+            uri (str): URL for the service.
+            **kwargs: Optional arguments to ``requests.Session.get``.
+
+        Raises:
+            DataSourceUnavailable: When the circuit breaker of the host is open.
+            requests.Timeout: When no slot is available after ``queue_timeout`` seconds or the deadline expired.
+        """
+        timeout = self._acquire()
+
+        started_at = time.monotonic()
+        failed = True
+
+        try:
+            with self._session.get(uri, timeout=timeout, stream=True, **kwargs) as response:
+                failed = response.status_code >= 500
+
+                yield response
+        except (requests.RequestException, urllib3.exceptions.HTTPError):
+            # Only the call cut by the expired deadline of its caller says nothing about the service
+            failed = None if self._abandoned() else True
+            raise
+        finally:
+            self._release(started_at, failed)
+
+    @staticmethod
+    def _abandoned() -> bool:
+        """Return whether the deadline of the calling thread has expired."""
+        remaining = deadline.remaining()
+
+        return remaining is not None and remaining <= 0
+
+    @contextmanager
+    def _stream(self, uri):
+        """Query the service using HTTP GET verb and give the response body as a file-like object.
+
+        The body is read (and decompressed) as it is consumed, so it can be parsed incrementally.
+        The response is closed when the context exits.
+
+        Args:
+            uri (str): URL for the service.
+        """
+        with self._open(uri) as response:
+            if response.status_code != 200:
+                raise Exception(f"Request Fail: {response.status_code}")
+
+            response.raw.decode_content = True
+
+            yield response.raw
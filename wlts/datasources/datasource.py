@@ -16,7 +16,10 @@
 # along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
 #
 """WLTS DataSource Abstract Collection."""
+import threading
+import time
 from abc import ABCMeta, abstractmethod
+from typing import Optional
 
 
 class DataSource(metaclass=ABCMeta):
@@ -29,13 +32,99 @@ class DataSource(metaclass=ABCMeta):
             id (str): Identifier of an datasource.
         """
         self._id = id
+        self._ready = threading.Event()
+        self._error = None
 
     @property
     def get_id(self):
         """Return the datasource identifier (id)."""
         return self._id
 
+    @property
+    def version(self) -> Optional[str]:
+        """Return an identifier of the datasource content, the same in all the worker processes.
+
+        It changes when the content changes. By default the content never changes (None).
+        """
+        return None
+
     @abstractmethod
     def get_type(self):
         """Return the datasource type."""
         pass
+
+    def load(self):
+        """Load the resources the datasource needs to serve requests (e.g. the service capabilities).
+
+        It runs in background, after the datasource is created. By default there is nothing to load.
+        """
+        pass
+
+    def refresh(self):
+        """Refresh the resources loaded by ``load`` (e.g. the service capabilities).
+
+        It runs in background, every ``refresh_interval`` seconds. By default there is nothing to refresh.
+        """
+        pass
+
+    @property
+    def refresh_interval(self):
+        """Return the time, in seconds, between the refreshes of the datasource, or None to never refresh it."""
+        return None
+
+    def start(self, retry_interval: float = 30) -> None:
+        """Start loading the datasource in a background thread.
+
+        A failed load is retried every ``retry_interval`` seconds until it succeeds. The thread
+        then refreshes the datasource every ``refresh_interval`` seconds.
+
+        Args:
+            retry_interval (float): The time, in seconds, between the load attempts.
+        """
+        thread = threading.Thread(target=self._load, args=(retry_interval,), name=f'wlts-datasource-{self._id}',
+                                  daemon=True)
+        thread.start()
+
+    def _load(self, retry_interval: float) -> None:
+        """Load the datasource, retrying until it succeeds, and then refresh it periodically."""
+        while True:
+            try:
+                self.load()
+            except Exception as e:
+                self._error = e
+                time.sleep(retry_interval)
+                continue
+
+            self._error = None
+            self._ready.set()
+            break
+
+        while self.refresh_interval:
+            time.sleep(self.refresh_interval)
+
+            try:
+                self.refresh()
+            except Exception:
+                # Keep serving the resources already loaded until the next refresh
+                pass
+
+    @property
+    def is_ready(self) -> bool:
+        """Return whether the datasource is loaded and ready to serve requests."""
+        return self._ready.is_set()
+
+    @property
+    def error(self):
+        """Return the error of the last failed load attempt, if any."""
+        return self._error
+
+    def wait_ready(self, timeout: float = None) -> bool:
+        """Wait until the datasource is ready.
+
+        Args:
+            timeout (float, optional): The maximum time, in seconds, to wait.
+
+        Returns:
+            bool: Whether the datasource is ready.
+        """
+        return self._ready.wait(timeout)
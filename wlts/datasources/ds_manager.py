@@ -16,6 +16,8 @@
 # along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
 #
 """WLTS DataSource Manager."""
+from wlts.config import Config
+
 from .wcs import WCSDataSource
 from .wfs import WFSDataSource
 
@@ -92,10 +94,16 @@ class DataSourceManager:
     def insert_datasource(self, conn_info):
         """Creates a new datasource and stores in list of datasource.
 
+        The datasource is loaded in background, so a slow or unavailable service does not block the startup.
+
         Args:
             conn_info (dict): The datasource connection information.
         """
-        self._datasources.append(DataSourceFactory.make(conn_info["type"], conn_info["id"], conn_info))
+        datasource = DataSourceFactory.make(conn_info["type"], conn_info["id"], conn_info)
+
+        self._datasources.append(datasource)
+
+        datasource.start(retry_interval=Config.WLTS_LOAD_RETRY_INTERVAL)
 
     def load_all(self) -> None:
         """Creates all datasource based on json of datasource."""
@@ -16,23 +16,25 @@
 # along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
 #
 """WLTS WCS DataSource."""
-import base64
-import urllib.request
-from functools import lru_cache
-from typing import List
-from uuid import uuid4
-from xml.dom import minidom
+import math
+import time
+from typing import FrozenSet, Optional
 
 import requests
+import urllib3
 from rasterio.io import MemoryFile
 from shapely.geometry import Point, mapping
 from werkzeug.exceptions import NotFound
 
+from wlts.datasources.capabilities import CapabilitiesCache
+from wlts.datasources.client import HTTPClient, session_options
 from wlts.datasources.datasource import DataSource
-from wlts.utils.utilities import get_date_from_str
+from wlts.utils.cache import create_cache
+from wlts.utils.utilities import (get_date_from_str, iter_xml_elements,
+                                  transform_coordinates)
 
 
-class WCS:
+class WCS(HTTPClient):
     """This class implements the WCS client.."""
 
     def __init__(self, host, **kwargs):
@@ -40,60 +42,47 @@ class WCS:
 
         Args:
             host (str): the server URL.
-            **kwargs: The keyword arguments with credentials to access WFS.
+            **kwargs: The keyword arguments with credentials and HTTP session options to access WCS.
         """
-        invalid_parameters = set(kwargs) - {"auth"}
+        super().__init__(host, **kwargs)
 
-        if invalid_parameters:
-            raise AttributeError(f'invalid parameter(s): {invalid_parameters}')
-
-        self._host = host
         self._base_path = "wcs?service=WCS"
         self.version = "&version=1.0.0"
 
-        self._auth = None
+        self._grids = dict()
 
-        if 'auth' in kwargs:
-            if kwargs['auth'] is not None:
-                if not type(kwargs['auth']) is tuple:
-                    raise AttributeError('auth must be a tuple ("user", "pass")')
-                if len(kwargs['auth']) != 2:
-                    raise AttributeError('auth must be a tuple with 2 values ("user", "pass")')
-                self._auth = kwargs['auth']
-
-        self.avaliable_images = self.list_image()
+        url = f"{self._host}/{self._base_path}&request=GetCapabilities&outputFormat=application/json"
 
-    @property
-    def host_information(self) -> str:
-        """Returns the host."""
-        return self._host
+        self._capabilities = CapabilitiesCache(self, url, self._parse_images, self._capabilities_refresh)
 
     def _request_image(self, uri):
         """Query the WCS service using HTTP GET verb and return the image result.
 
+        Compressed (gzip or deflate) responses are decompressed while they are streamed into memory.
+
         Args:
             uri (str): URL for the WCS server.
-        """
-        if self._auth:
-            request = urllib.request.Request(uri)
 
-            credentials = ('%s:%s' % (self._auth[0], self._auth[1])).replace('\n', '')
-            encoded_credentials = base64.b64encode(credentials.encode('ascii'))
+        Returns:
+            rasterio.io.MemoryFile: The image, or None when the service answers an error.
 
-            request.add_header('Accept-Encoding', "gzip")
-            request.add_header('Authorization', 'Basic %s' % encoded_credentials.decode("ascii"))
+        Raises:
+            requests.RequestException: When the request fails, e.g. it times out or the circuit breaker is open.
+        """
+        with self._open(uri) as response:
+            if response.status_code != 200:
+                return None
 
-        else:
-            request = urllib.request.Request(uri, headers={"Accept-Encoding": "gzip"})
+            memfile = MemoryFile()
 
-        try:
-            response = urllib.request.urlopen(request, timeout=30)
-            if response.info().get('Content-Encoding') == 'gzip':
-                return None
-            else:
-                return response
-        except urllib.request.URLError:
-            return None
+            try:
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    memfile.write(chunk)
+            except BaseException:
+                memfile.close()
+                raise
+
+            return memfile
 
     def open_image(self, url, long, lat):
         """Return the image value for a location.
@@ -103,23 +92,39 @@ class WCS:
             long (int/float): A longitude value according to EPSG:4326.
             lat (int/float): A latitude value according to EPSG:4326.
         """
-        image_data = self._request_image(url)
+        values = self.sample_image(url, [(long, lat)])
 
-        if not image_data:
+        if values is None:
             return None
 
-        mmap_name = "/vsimem/" + uuid4().hex
-        data = image_data.read()
+        return values[0]
+
+    def sample_image(self, url, points):
+        """Return the image values for a list of locations.
+
+        Args:
+            url (str): URL for the WCS server.
+            points (list): A list of (x, y) tuples in the image CRS.
+
+        Returns:
+            list: The value of each location, or None when the image could not be read.
+
+        Raises:
+            requests.RequestException: When the request fails, e.g. it times out or the circuit breaker is open.
+        """
+        memfile = self._request_image(url)
+
+        if memfile is None:
+            return None
 
         try:
-            with MemoryFile(data) as memfile:
+            with memfile:
                 with memfile.open() as dataset:
-                    values = list(dataset.sample([(long, lat)]))
-            return values[0][0]
+                    values = [value[0] for value in dataset.sample(points)]
+            return values
         except:
             return None
 
-    @lru_cache()
     def get_image(self, image, srid, min_x, max_x, min_y, max_y, column, row, time, x, y):
         """Mount the url for get a image(coverage) from server based on GetCoverage request.
 
@@ -144,40 +149,129 @@ class WCS:
 
         url += f"&FORMAT=GeoTIFF&WIDTH={column}&HEIGHT={row}&time={time}"
 
-        return self.open_image(url, x, y)
+        return self._flights.do((url, x, y), self.open_image, url, x, y)
 
-    def _get(self, uri):
-        """Query the WCS service using HTTP GET verb.
+    def read_window(self, image, srid, min_x, min_y, max_x, max_y, column, row, time):
+        """Retrieve a native resolution window of an image(coverage).
 
         Args:
-            uri (str): URL for the WCS server.
+            image (str): The image(coverage) name to retrieve from service.
+            srid (int): The CRS of the image(coverage) and of the window bounds.
+            min_x (int/float): The min x of the window.
+            min_y (int/float): The min y of the window.
+            max_x (int/float): The max x of the window.
+            max_y (int/float): The max y of the window.
+            column (int): Number of columns of the window.
+            row (int): Number of rows of the window.
+            time (str): Time dimension.
+
+        Returns:
+            numpy.ndarray: The first band of the window, with shape (row, column), or None when it could not be read.
+
+        Raises:
+            requests.RequestException: When the request fails, e.g. it times out or the circuit breaker is open.
         """
-        with requests.session() as s:
-            s.keep_alive = False
-            response = s.get(uri, auth=self._auth)
+        url = f"{self._host}/{self._base_path}{self.version}&request=GetCoverage&COVERAGE={image}&"
 
-        if response.status_code != 200:
-            raise Exception(f"Request Fail: {response.status_code}")
+        url += f"CRS=EPSG:{srid}&RESPONSE_CRS=EPSG:{srid}&"
 
-        return response.content.decode('utf-8')
+        url += f"BBOX={min_x},{min_y},{max_x},{max_y}"
 
-    def list_image(self) -> List[str]:
-        """Returns the list of all available image in service."""
-        url = f"{self._host}/{self._base_path}&request=GetCapabilities&outputFormat=application/json"
+        url += f"&FORMAT=GeoTIFF&WIDTH={column}&HEIGHT={row}&time={time}"
+
+        # The returned window is shared by the concurrent identical calls, so it must not be modified
+        return self._flights.do(url, self._read_window, url, column, row)
+
+    def _read_window(self, url, column, row):
+        """Retrieve the first band of a GetCoverage request, or None when it could not be read."""
+        memfile = self._request_image(url)
+
+        if memfile is None:
+            return None
+
+        try:
+            with memfile:
+                with memfile.open() as dataset:
+                    data = dataset.read(1)
+        except:
+            return None
+
+        if data.shape != (row, column):
+            return None
+
+        return data
 
-        doc = self._get(url)
+    def describe_image(self, image):
+        """Return the native grid of an image(coverage) based on DescribeCoverage request.
 
-        xmldoc = minidom.parseString(doc)
+        The grid origin is the center of the upper left pixel, as described by GML ``RectifiedGrid``.
 
-        itemlist = xmldoc.getElementsByTagName('wcs:Contents')
+        A failed description (an error answer or an invalid document) is remembered too, and only requested
+        again after ``capabilities_refresh`` seconds, so a server that does not describe its coverages costs
+        a single request.
+
+        Args:
+            image (str): The image(coverage) name.
 
-        avaliables = []
+        Returns:
+            dict: The grid with ``min_x``, ``max_y`` (upper left corner), ``res_x``, ``res_y``,
+            ``column`` and ``row``, or None when the server does not describe it.
 
-        for s in itemlist[0].childNodes:
-            coverage_id = s.getElementsByTagName('wcs:CoverageId')
-            avaliables.append(coverage_id[0].firstChild.nodeValue)
+        Raises:
+            requests.RequestException: When the request fails, e.g. it times out or the circuit breaker is open.
+        """
+        if image in self._grids:
+            grid, described_at = self._grids[image]
+
+            if grid is not None or time.monotonic() - described_at < self._capabilities_refresh:
+                return grid
+
+        url = f"{self._host}/{self._base_path}{self.version}&request=DescribeCoverage&COVERAGE={image}"
+
+        try:
+            elements = dict(low=[], high=[], pos=[], offsetVector=[])
+
+            with self._stream(url) as body:
+                names = dict(low=None, high=None, pos='origin', offsetVector=None)
+
+                for name, text in iter_xml_elements(body, names):
+                    elements[name].append(text.split())
+
+            low, high = elements['low'][0], elements['high'][0]
+            origin = [float(v) for v in elements['pos'][0]]
+            offsets = [[float(v) for v in offset] for offset in elements['offsetVector']]
+
+            res_x, res_y = abs(offsets[0][0]), abs(offsets[1][1])
+
+            grid = dict(
+                min_x=origin[0] - res_x / 2,
+                max_y=origin[1] + res_y / 2,
+                res_x=res_x,
+                res_y=res_y,
+                column=int(high[0]) - int(low[0]) + 1,
+                row=int(high[1]) - int(low[1]) + 1
+            )
+        except (requests.RequestException, urllib3.exceptions.HTTPError):
+            # A transient failure (or an unavailable datasource) is not a missing description: it is not
+            # remembered, and the caller reports it
+            raise
+        except Exception:
+            grid = None
+
+        self._grids[image] = (grid, time.monotonic())
+
+        return grid
+
+    @staticmethod
+    def _parse_images(body):
+        """Return the coverage identifiers of a GetCapabilities document."""
+        return [name for _, name in iter_xml_elements(body, {'CoverageId': 'Contents'})]
+
+    @property
+    def avaliable_images(self) -> FrozenSet[str]:
+        """Return the images (coverages) available in service, refreshed periodically."""
+        return self._capabilities.names
 
-        return avaliables
 
 
 class WCSDataSource(DataSource):
@@ -193,16 +287,35 @@ class WCSDataSource(DataSource):
         super().__init__(id)
 
         if 'user' in ds_info and 'password' in ds_info:
-            self._wcs = WCS(ds_info['host'], auth=(ds_info["user"], ds_info["password"]))
+            self._wcs = WCS(ds_info['host'], auth=(ds_info["user"], ds_info["password"]), **session_options(ds_info))
         else:
-            self._wcs = WCS(ds_info['host'])
+            self._wcs = WCS(ds_info['host'], **session_options(ds_info))
 
         if 'external_host' in ds_info:
             self._external_host = ds_info['external_host']
         else:
             self._external_host = ds_info['host']
 
-    @lru_cache()
+        self._max_window = int(ds_info.get('max_window', 1024))
+        self._sampling_window = max(1, int(ds_info.get('sampling_window', 32)))
+
+        self._tiles = create_cache(f'tiles:{id}',
+                                   max_bytes=int(ds_info.get('tile_cache_size', 64)) * 1024 * 1024,
+                                   ttl=float(ds_info.get('tile_cache_ttl', 3600)))
+
+    def load(self):
+        """Load the images (coverages) available in the service."""
+        self._wcs.load_capabilities()
+
+    def refresh(self):
+        """Refresh the images (coverages) available in the service."""
+        self._wcs.load_capabilities()
+
+    @property
+    def refresh_interval(self) -> float:
+        """Return the time, in seconds, between the refreshes of the service capabilities."""
+        return self._wcs.capabilities_refresh
+
     def check_image(self, workspace: str, ft_name: str) -> None:
         """Utility to check image existence in wcs.
 
@@ -217,14 +330,17 @@ class WCSDataSource(DataSource):
         """Returns the host."""
         return self._external_host
 
+    @property
+    def version(self) -> Optional[str]:
+        """Return the version of the service capabilities."""
+        return self._wcs.capabilities_version
+
     def get_type(self) -> str:
         """Return the datasource type."""
         return "WCS"
 
     def organize_trajectory(self, result, time, classification_class, geom, geom_flag, temporal, language, workspace=None):
         """Organize trajectory."""
-        import ast
-
         # Get temporal information
         obs_info = get_date_from_str(time)
         obs_info = obs_info.strftime(temporal["string_format"])
@@ -233,21 +349,7 @@ class WCSDataSource(DataSource):
         if classification_class.type == "Self":
             class_info = str(result)
         else:
-            ds_class = classification_class.get_class_ds()
-
-            class_retval =  ds_class.get_classe(feature_id=result,
-                                             value=classification_class.class_property_value,
-                                             class_property_name=classification_class.class_property_name,
-                                             ft_name=classification_class.property_name,
-                                             workspace=classification_class.workspace,
-                                             classification_system_id=classification_class.classification_system_id
-                                             )
-
-            class_dict = ast.literal_eval(class_retval)
-            if language in class_dict:
-                class_info = class_dict[language]
-            else:
-                class_info = class_dict[list(class_dict.keys())[0]]
+            class_info = classification_class.get_class(result, language)
 
         trj = dict()
         trj["class"] = class_info
@@ -261,6 +363,10 @@ class WCSDataSource(DataSource):
     def get_trajectory(self, **kwargs):
         """Return a trajectory instance for wcs datasource.
 
+        When the server describes the native grid of the image, only the ``sampling_window`` x ``sampling_window``
+        native pixels tile that contains the location is retrieved (or taken from the tiles cache). Otherwise,
+        the image is retrieved with the collection ``grid`` size around the location.
+
         Args:
             **kwargs: The keyword arguments.
         """
@@ -270,36 +376,180 @@ class WCSDataSource(DataSource):
         if invalid_parameters:
             raise AttributeError('invalid parameter(s): {}'.format(invalid_parameters))
 
-        ts = get_date_from_str(kwargs['time'])
+        image_name =  kwargs['workspace'] + ":" + kwargs['image']
 
-        if kwargs['start_date']:
-            start_date = get_date_from_str(kwargs['start_date'])
-            if ts < start_date:
-                return None
-        if kwargs['end_date']:
-            end_date = get_date_from_str(kwargs['end_date'])
-            if ts > end_date:
-                return None
+        grid = self._wcs.describe_image(image_name)
 
-        image_name =  kwargs['workspace'] + ":" + kwargs['image']
+        if grid is not None:
+            # Point sampling: retrieve only the native pixels around the location
+            (x,), (y,) = transform_coordinates('EPSG:4326', f"EPSG:{kwargs['srid']}", [kwargs['x']], [kwargs['y']])
 
-        min_x, min_y, max_x, max_y = Point(kwargs['x'], kwargs['y']).buffer(0.002).bounds
+            pixel = self._pixel(grid, x, y)
 
-        image_infos = self._wcs.get_image(image_name, kwargs['srid'],
-                                          min_x, min_y, max_x, max_y,
-                                          (kwargs['grid'])['column'], (kwargs['grid'])['row'],
-                                          kwargs['time'], kwargs['x'], kwargs['y'])
+            if pixel is None:
+                return None
 
-        if image_infos is not None:
-            trj = self.organize_trajectory(result=image_infos, time=kwargs['time'],
-                                           classification_class=kwargs['classification_class'],
-                                           geom=Point(kwargs['x'], kwargs['y']),
-                                           geom_flag=kwargs['geometry_flag'],
-                                           temporal=kwargs['temporal'],
-                                           language=kwargs['language'],
-                                           workspace=kwargs['workspace']
-                                           )
+            image_infos = self._sample(image_name, kwargs['srid'], grid, kwargs['time'], [pixel])[0]
+        else:
+            image_infos = self._get_image(image_name, kwargs['srid'], kwargs['grid'], kwargs['time'],
+                                          kwargs['x'], kwargs['y'])
 
-            return trj
+        if image_infos is not None:
+            return self._organize(image_infos, Point(kwargs['x'], kwargs['y']), **kwargs)
 
         return image_infos
+
+    def get_trajectories(self, points, **kwargs):
+        """Return the trajectory observations of this datasource for a set of locations.
+
+        The tiles of the locations that are not cached are grouped in windows of up to
+        ``max_window`` x ``max_window`` native pixels, and each window is retrieved once, in the
+        native resolution of the image. When the server does not describe the image grid, each
+        location is retrieved individually.
+
+        Args:
+            points (list): A list of (longitude, latitude) tuples according to EPSG:4326.
+            **kwargs: The trajectory keyword arguments, without ``x`` and ``y``.
+
+        Returns:
+            list: The observation of each location (or None), in the order of ``points``.
+        """
+        invalid_parameters = set(kwargs) - {"image", "workspace", "temporal", "srid", "grid", "start_date",
+                                            "end_date", "time", "classification_class", "geometry_flag",  "language"}
+
+        if invalid_parameters:
+            raise AttributeError('invalid parameter(s): {}'.format(invalid_parameters))
+
+        trajectories = [None for _ in points]
+
+        image_name = kwargs['workspace'] + ":" + kwargs['image']
+
+        grid = self._wcs.describe_image(image_name)
+
+        if grid is None:
+            return [self.get_trajectory(x=x, y=y, **kwargs) for x, y in points]
+
+        xs, ys = transform_coordinates('EPSG:4326', f"EPSG:{kwargs['srid']}",
+                                       [p[0] for p in points], [p[1] for p in points])
+
+        pixels = [self._pixel(grid, x, y) for x, y in zip(xs, ys)]
+
+        indexes = [index for index, pixel in enumerate(pixels) if pixel is not None]
+
+        values = self._sample(image_name, kwargs['srid'], grid, kwargs['time'], [pixels[i] for i in indexes])
+
+        for index, value in zip(indexes, values):
+            if value is not None:
+                trajectories[index] = self._organize(value, Point(*points[index]), **kwargs)
+
+        return trajectories
+
+    def _get_image(self, image_name, srid, grid, time, x, y):
+        """Return the image value of a location, retrieved with the collection ``grid`` size around it.
+
+        It is used when the server does not describe the native grid of the image. The values are kept
+        in the tiles cache, by location, and the failed requests are not cached.
+        """
+        key = ('point', image_name, time, srid, grid['column'], grid['row'], x, y)
+
+        value = self._tiles.get(key)
+
+        if value is None:
+            min_x, min_y, max_x, max_y = Point(x, y).buffer(0.002).bounds
+
+            value = self._wcs.get_image(image_name, srid, min_x, min_y, max_x, max_y,
+                                        grid['column'], grid['row'], time, x, y)
+
+            if value is not None:
+                self._tiles.set(key, value)
+
+        return value
+
+    @staticmethod
+    def _pixel(grid, x, y):
+        """Return the (column, row) of the native pixel that contains a location, or None if outside."""
+        column = math.floor((x - grid['min_x']) / grid['res_x'])
+        row = math.floor((grid['max_y'] - y) / grid['res_y'])
+
+        if not (0 <= column < grid['column'] and 0 <= row < grid['row']):
+            return None
+
+        return column, row
+
+    def _sample(self, image_name, srid, grid, time, pixels):
+        """Return the values of native pixels of an image.
+
+        The image is split in a fixed grid of ``sampling_window`` x ``sampling_window`` pixels tiles and the
+        retrieved tiles are kept in a cache, so any pixel of a cached tile is answered without a request.
+        The missing tiles are retrieved in windows of up to ``max_window`` x ``max_window`` pixels.
+
+        Args:
+            image_name (str): The image(coverage) name.
+            srid (int): The CRS of the image(coverage).
+            grid (dict): The native grid of the image.
+            time (str): Time dimension.
+            pixels (list): A list of (column, row) native pixels.
+
+        Returns:
+            list: The value of each pixel, or None when it could not be retrieved.
+        """
+        size = self._sampling_window
+        values = [None for _ in pixels]
+        missing = dict()
+
+        for index, (column, row) in enumerate(pixels):
+            tile = self._tiles.get((image_name, time, size, column // size, row // size))
+
+            if tile is None:
+                missing.setdefault((column // size, row // size), list()).append(index)
+            else:
+                values[index] = tile[row % size, column % size]
+
+        tiles_by_window = max(1, self._max_window // size)
+        windows = dict()
+
+        for tile_column, tile_row in missing:
+            key = (tile_column // tiles_by_window, tile_row // tiles_by_window)
+            windows.setdefault(key, list()).append((tile_column, tile_row))
+
+        for tiles in windows.values():
+            min_column = min(c for c, _ in tiles) * size
+            min_row = min(r for _, r in tiles) * size
+            max_column = min((max(c for c, _ in tiles) + 1) * size, grid['column']) - 1
+            max_row = min((max(r for _, r in tiles) + 1) * size, grid['row']) - 1
+
+            data = self._wcs.read_window(image_name, srid,
+                                         grid['min_x'] + min_column * grid['res_x'],
+                                         grid['max_y'] - (max_row + 1) * grid['res_y'],
+                                         grid['min_x'] + (max_column + 1) * grid['res_x'],
+                                         grid['max_y'] - min_row * grid['res_y'],
+                                         max_column - min_column + 1, max_row - min_row + 1,
+                                         time)
+
+            if data is None:
+                continue
+
+            for tile_column, tile_row in tiles:
+                offset_column = tile_column * size - min_column
+                offset_row = tile_row * size - min_row
+
+                tile = data[offset_row:offset_row + size, offset_column:offset_column + size].copy()
+
+                self._tiles.set((image_name, time, size, tile_column, tile_row), tile)
+
+                for index in missing[(tile_column, tile_row)]:
+                    column, row = pixels[index]
+                    values[index] = tile[row % size, column % size]
+
+        return values
+
+    def _organize(self, value, geom, **kwargs):
+        """Organize the trajectory observation of an image value."""
+        return self.organize_trajectory(result=value, time=kwargs['time'],
+                                        classification_class=kwargs['classification_class'],
+                                        geom=geom,
+                                        geom_flag=kwargs['geometry_flag'],
+                                        temporal=kwargs['temporal'],
+                                        language=kwargs['language'],
+                                        workspace=kwargs['workspace']
+                                        )
@@ -16,19 +16,23 @@
 # along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
 #
 """WLTS WFS DataSource."""
-from functools import lru_cache
+import re
 from json import loads as json_loads
-from xml.dom import minidom
+from typing import FrozenSet, Optional
 
-import requests
-from shapely.geometry import MultiPolygon, Point, Polygon, mapping
+from shapely.geometry import MultiPoint, Point, shape
+from shapely.prepared import prep
 from werkzeug.exceptions import NotFound
 
+from wlts.datasources.capabilities import CapabilitiesCache
+from wlts.datasources.client import HTTPClient, session_options
 from wlts.datasources.datasource import DataSource
-from wlts.utils.utilities import get_date_from_str, transform_crs
+from wlts.utils.cache import create_cache
+from wlts.utils.utilities import (get_date_from_str, iter_xml_elements,
+                                  transform_geojson)
 
 
-class WFS:
+class WFS(HTTPClient):
     """This class implements the WCS client."""
 
     def __init__(self, host, **kwargs):
@@ -36,30 +40,15 @@ class WFS:
 
         Args:
             host (str): the server URL.
-            **kwargs: The keyword arguments with credentials to access WFS.
+            **kwargs: The keyword arguments with credentials and HTTP session options to access WFS.
         """
-        invalid_parameters = set(kwargs) - {"auth"}
+        super().__init__(host, **kwargs)
 
-        if invalid_parameters:
-            raise AttributeError('invalid parameter(s): {}'.format(invalid_parameters))
-
-        self._host = host
         self._base_path = "wfs?service=WFS&version=1.0.0"
 
-        self._auth = None
-
-        if 'auth' in kwargs:
-            if kwargs['auth'] is not None:
-                if not type(kwargs['auth']) is tuple:
-                    raise AttributeError('auth must be a tuple ("user", "pass")')
-                if len(kwargs['auth']) != 2:
-                    raise AttributeError('auth must be a tuple with 2 values ("user", "pass")')
-                self._auth = kwargs['auth']
+        url = "{}/{}&request=GetCapabilities&outputFormat=application/json".format(self._host, self._base_path)
 
-    @property
-    def host_information(self) -> str:
-        """Returns the host."""
-        return self._host
+        self._capabilities = CapabilitiesCache(self, url, self._parse_features, self._capabilities_refresh)
 
     def _get(self, uri):
         """Query the WFS service using HTTP GET verb.
@@ -67,40 +56,22 @@ class WFS:
         Args:
             uri (str): URL for the WCS server.
         """
-        response = requests.get(uri, auth=self._auth)
+        response = self._request(uri)
 
         if response.status_code != 200:
             raise Exception("Request Fail: {} ".format(response.status_code))
 
         return response.content.decode('utf-8')
 
-    def _list_features(self):
-        """Returns the list of all available feature in service."""
-        url = "{}/{}&request=GetCapabilities&outputFormat=application/json".format(self._host, self._base_path)
-
-        doc = self._get(url)
+    @staticmethod
+    def _parse_features(body):
+        """Return the feature type names of a GetCapabilities document."""
+        return [name for _, name in iter_xml_elements(body, {'Name': 'FeatureType'})]
 
-        xmldoc = minidom.parseString(doc)
-        itemlist = xmldoc.getElementsByTagName('FeatureType')
-
-        features = dict()
-        features[u'features'] = []
-
-        for s in itemlist:
-            features[u'features'].append(s.childNodes[0].firstChild.nodeValue)
-
-        return features
-
-    def check_feature(self, ft_name):
-        """Utility to check feature existence in wfs.
-
-        Args:
-            ft_name (str): The feature name to check.
-        """
-        features = self._list_features()
-
-        if ft_name not in features['features']:
-            raise NotFound('Feature "{}" not found'.format(ft_name))
+    @property
+    def avaliable_features(self) -> FrozenSet[str]:
+        """Return the feature types available in service, refreshed periodically."""
+        return self._capabilities.names
 
     def mount_url(self, type_name, **kwargs):
         """Mount the url for get a feature from server based on GetFeature request.
@@ -109,11 +80,12 @@ class WFS:
             type_name (str): Name of the feature type.
             **kwargs: The keyword arguments:
                 srid (int): EPSG code
+                srsName (str): The CRS of the returned geometries, reprojected by the server.
                 propertyName (str): Feature property names
                 filter (str): Filter to use in request.
                 outputformat (str): Requested response format of the request.
         """
-        invalid_parameters = set(kwargs) - {'srid', 'propertyName', 'filter', 'outputformat'}
+        invalid_parameters = set(kwargs) - {'srid', 'srsName', 'propertyName', 'filter', 'outputformat'}
 
         if invalid_parameters:
             raise AttributeError('invalid parameter(s): {}'.format(invalid_parameters))
@@ -126,7 +98,9 @@ class WFS:
         if 'outputformat' in kwargs:
             url += kwargs['outputformat']
 
-        if 'srid' in kwargs:
+        if 'srsName' in kwargs:
+            url += "&srsName={}".format(kwargs['srsName'])
+        elif 'srid' in kwargs:
             url += "&CRS=EPSG:{}".format(kwargs['srid'])
 
         if 'filter' in kwargs:
@@ -136,37 +110,73 @@ class WFS:
 
         return url
 
-    def get_feature(self, type_name, srid, filter):
-        """Retrieve the feature collection given feature."""
-        args = {"srid": srid, "filter": filter, "outputformat": "&outputformat=json"}
+    def get_feature_collection(self, type_name, srid, filter, srs_name=None):
+        """Retrieve the GeoJSON feature collection of a GetFeature request.
+
+        Args:
+            type_name (str): Name of the feature type.
+            srid (int): EPSG code of the feature type.
+            filter (str): Filter to use in request.
+            srs_name (str, optional): The CRS the server must reproject the geometries to.
+
+        Returns:
+            dict: The GeoJSON feature collection.
+        """
+        args = {"filter": filter, "outputformat": "&outputformat=json"}
+
+        if srid is not None:
+            args["srid"] = srid
+
+        if srs_name is not None:
+            args["srsName"] = srs_name
 
         url = self.mount_url(type_name, **args)
 
-        doc = self._get(url)
+        return self._flights.do(url, self._get_json, url)
 
-        js = json_loads(doc)
+    def _get_json(self, uri):
+        """Query the WFS service using HTTP GET verb and decode the JSON result."""
+        return json_loads(self._get(uri))
+
+    def get_feature(self, type_name, srid, filter):
+        """Retrieve the feature collection given feature."""
+        js = self.get_feature_collection(type_name, srid, filter)
 
         if not js["features"]:
             return None
         else:
             return js["features"]
 
-    @lru_cache()
+    @staticmethod
+    def collection_srid(collection):
+        """Return the EPSG code of the geometries of a GeoJSON feature collection, or None when it has no CRS."""
+        name = ((collection.get('crs') or {}).get('properties') or {}).get('name')
+
+        if name is None:
+            return None
+
+        match = re.search(r'(\d+)$', name)
+
+        return int(match.group(1)) if match else None
+
     def get_class(self, type_name, tag_name, filter):
         """Return a class of given feature."""
         args = {"filter": "&cql_filter={}".format(filter)}
 
         url = self.mount_url(type_name, **args)
 
-        doc = self._get(url)
-
-        xmldoc = minidom.parseString(doc)
+        # The tag name is qualified by the workspace prefix
+        name = tag_name.rsplit(':', 1)[-1]
 
-        itemlist = xmldoc.getElementsByTagName(tag_name)
+        return self._flights.do((url, name), self._get_class, url, name)
 
-        result = itemlist[0].firstChild.nodeValue
+    def _get_class(self, url, name):
+        """Return the text of the first element with the given name of a GetFeature request."""
+        with self._stream(url) as body:
+            for _, result in iter_xml_elements(body, {name: None}):
+                return result
 
-        return result
+        raise IndexError(f'Class not found: {url}')
 
 
 class WFSDataSource(DataSource):
@@ -182,24 +192,70 @@ class WFSDataSource(DataSource):
         super().__init__(id)
 
         if 'user' in ds_info and 'password' in ds_info:
-            self._wfs = WFS(ds_info['host'], auth=(ds_info["user"], ds_info["password"]))
+            self._wfs = WFS(ds_info['host'], auth=(ds_info["user"], ds_info["password"]), **session_options(ds_info))
         else:
-            self._wfs = WFS(ds_info['host'])
+            self._wfs = WFS(ds_info['host'], **session_options(ds_info))
 
         if 'external_host' in ds_info:
             self._external_host = ds_info['external_host']
         else:
             self._external_host = ds_info['host']
 
+        self._batch_size = int(ds_info.get('batch_size', 100))
+        self._server_reprojection = bool(ds_info.get('server_reprojection', False))
+
+        self._features = create_cache(f'features:{id}',
+                                      max_bytes=int(ds_info.get('feature_cache_size', 32)) * 1024 * 1024,
+                                      ttl=float(ds_info.get('feature_cache_ttl', 300)))
+        self._geometry_precision = ds_info.get('geometry_precision')
+        self._geometry_simplify = ds_info.get('geometry_simplify')
+
+        if self._geometry_precision is not None:
+            self._geometry_precision = int(self._geometry_precision)
+
+        if self._geometry_simplify is not None:
+            self._geometry_simplify = float(self._geometry_simplify)
+
+        self._class_cache_ttl = float(ds_info.get('class_cache_ttl', 86400))
+        self._classes = create_cache(f'classes:{id}', max_bytes=8 * 1024 * 1024, ttl=self._class_cache_ttl)
+
     def get_type(self) -> str:
         """Return the datasource type."""
         return "WFS"
 
+    def load(self):
+        """Load the feature types available in the service."""
+        self._wfs.load_capabilities()
+
+    def refresh(self):
+        """Refresh the feature types available in the service."""
+        self._wfs.load_capabilities()
+
+    @property
+    def refresh_interval(self) -> float:
+        """Return the time, in seconds, between the refreshes of the service capabilities."""
+        return self._wfs.capabilities_refresh
+
+    def check_feature(self, workspace: str, ft_name: str) -> None:
+        """Utility to check feature type existence in wfs.
+
+        Args:
+            workspace (str): The feature type workspace.
+            ft_name (str): The feature type name.
+        """
+        if f'{workspace}:{ft_name}' not in self._wfs.avaliable_features:
+            raise NotFound(f'Feature "{ft_name}" not found')
+
     @property
     def host_information(self) -> str:
         """Returns the host."""
         return self._external_host
 
+    @property
+    def version(self) -> Optional[str]:
+        """Return the version of the service capabilities."""
+        return self._wfs.capabilities_version
+
     def get_classe(self, feature_id, value, class_property_name, ft_name, workspace, **kwargs):
         """Return a class of feature based on his classification system."""
         type_name = workspace + ":" + ft_name
@@ -210,12 +266,88 @@ class WFSDataSource(DataSource):
         else:
             filter = f"{value}={feature_id}"
 
-        return self._wfs.get_class(type_name=type_name, tag_name=tag_name, filter=filter)
+        key = (type_name, tag_name, filter)
+        result = self._classes.get(key)
 
-    def organize_trajectory(self, result, obs, geom_flag, geom_property, classification_class, temporal, language):
-        """Organize trajectory."""
-        import ast
+        if result is None:
+            result = self._wfs.get_class(type_name=type_name, tag_name=tag_name, filter=filter)
+            self._classes.set(key, result)
+
+        return result
+
+    def get_classes(self, ft_name, workspace, value, class_property_name, classification_system_id=None) -> dict:
+        """Return all the classes of a classification system, retrieved in a single GetFeature request.
+
+        Args:
+            ft_name (str): The feature type with the classes.
+            workspace (str): The workspace of the feature type.
+            value (str): The class identifier property.
+            class_property_name (str): The class name property.
+            classification_system_id (int, optional): The classification system identifier.
+
+        Returns:
+            dict: The class name of each class identifier (as string).
+        """
+        type_name = f"{workspace}:{ft_name}" if workspace else ft_name
 
+        filter = f"&propertyName={value},{class_property_name}"
+
+        if classification_system_id is not None:
+            filter += f"&CQL_FILTER=classification_system_id={classification_system_id}"
+
+        features = self._wfs.get_feature(type_name=type_name, srid=None, filter=filter) or []
+
+        return {str(feature['properties'][value]): feature['properties'][class_property_name] for feature in features}
+
+    @property
+    def class_cache_ttl(self) -> float:
+        """Return the time, in seconds, the classes of a classification system are cached."""
+        return self._class_cache_ttl
+
+    def _get_feature(self, type_name, srid, filter):
+        """Retrieve the features of a GetFeature request, using the features cache.
+
+        When the datasource supports server reprojection the geometries are requested in EPSG:4326.
+        If the server does not honor it, the datasource falls back to the local reprojection.
+
+        Returns:
+            tuple: The features (or None) and the EPSG code of their geometries.
+        """
+        srs_name = 'EPSG:4326' if self._server_reprojection else None
+
+        key = (type_name, srid, srs_name, filter)
+        retval = self._features.get(key)
+
+        if retval is None:
+            collection = self._wfs.get_feature_collection(type_name=type_name, srid=srid, filter=filter,
+                                                          srs_name=srs_name)
+
+            features_srid = self._wfs.collection_srid(collection)
+
+            if features_srid is None:
+                # GeoJSON without CRS: EPSG:4326 when it was requested, otherwise the native CRS
+                features_srid = 4326 if srs_name else srid
+            elif srs_name and features_srid != 4326:
+                self._server_reprojection = False
+
+            retval = (collection['features'] or [], features_srid)
+            self._features.set(key, retval)
+
+        features, features_srid = retval
+
+        return (features if features else None), features_srid
+
+    def _transform_geometries(self, srid, geometries):
+        """Reproject the GeoJSON geometries of the features to EPSG:4326."""
+        if int(srid) == 4326 and self._geometry_precision is None and self._geometry_simplify is None:
+            return geometries
+
+        return transform_geojson(f'EPSG:{srid}', 'EPSG:4326', geometries,
+                                 precision=self._geometry_precision, tolerance=self._geometry_simplify)
+
+    def organize_trajectory(self, result, obs, geom_flag, geom_property, classification_class, temporal, language,
+                            geom=None):
+        """Organize trajectory."""
         # Get the temporal information based on temporal type
 
         if temporal["type"] == "STRING":
@@ -240,56 +372,121 @@ class WFSDataSource(DataSource):
 
         else:
             # Get the class from the lcss
-            feature_id = result['properties'][obs["class_property"]]
-
-            ds_class = classification_class.get_class_ds()
-
-            if classification_class.classification_system_name is None:
-                class_info = ds_class.get_classe(feature_id=feature_id,
-                                                 value=classification_class.class_property_value,
-                                                 class_property_name=classification_class.class_property_name,
-                                                 ft_name=classification_class.property_name)
-            else:
-                class_retval =  ds_class.get_classe(feature_id=feature_id,
-                                                    value=classification_class.class_property_value,
-                                                    class_property_name=classification_class.class_property_name,
-                                                    ft_name=classification_class.property_name,
-                                                    workspace=classification_class.workspace,
-                                                    classification_system_id=classification_class.classification_system_id)
-
-                class_dict = ast.literal_eval(class_retval)
-
-                if language in class_dict:
-                    class_info = class_dict[language]
-                else:
-                    class_info = class_dict[list(class_dict.keys())[0]]
+            class_info = classification_class.get_class(result['properties'][obs["class_property"]], language)
 
         trj = dict()
         trj["class"] = class_info
         trj["date"] = str(obs_info)
 
         if geom_flag:
-            if result['geometry']['type'] == 'Point':
-                geom = Point(result['geometry']['coordinates'][0], result['geometry']['coordinates'][1])
-            elif result['geometry']['type'] == 'MultiPolygon':
-                polygons = []
-                for polygon in result['geometry']['coordinates']:
-                    polygons += [Polygon(lr) for lr in polygon]
-                geom = MultiPolygon(polygons)
-            elif result['geometry']['type'] == 'Polygon':
-                geom = Polygon(result['geometry']['coordinates'][0])
-            else:
-                raise Exception('Unsupported geometry type.')
-
-            crs_orig = f'EPSG:{geom_property}'
-            geom_tmp = transform_crs(crs_orig, 'EPSG:4326', geom)
-
-            trj["geom"] = mapping(geom_tmp)
+            if geom is None:
+                geom, = self._transform_geometries(geom_property, [result['geometry']])
+
+            trj["geom"] = geom
 
         return trj
 
+    def _mount_query(self, geom, temporal_properties, **kwargs):
+        """Mount the CQL filter and the property names of a GetFeature request for a temporal property.
+
+        Args:
+            geom (shapely.geometry.base.BaseGeometry): The geometry used in the spatial filter.
+            temporal_properties (dict): The temporal property.
+            **kwargs: The trajectory keyword arguments.
+
+        Returns:
+            tuple: The CQL filter and the list of property names (without the geometry).
+        """
+        property_names = [temporal_properties['class_property']]
+
+        cql_filter = "&CQL_FILTER=INTERSECTS({}, {})".format((kwargs['geom_property'])['property_name'], geom.wkt)
+
+        # The temporal properties of STRING collections are selected by the collection timeline
+        if (kwargs['temporal'])["type"] != "STRING":
+            if kwargs['start_date']:
+                start_date = get_date_from_str(kwargs['start_date'])
+                cql_filter += " AND {} >= {}".format(temporal_properties["temporal_property"],
+                                                     start_date.strftime((kwargs['temporal'])["string_format"]))
+
+            if kwargs['end_date']:
+                end_date = get_date_from_str(kwargs['end_date'])
+                cql_filter += " AND {} <= {}".format(temporal_properties["temporal_property"],
+                                                     end_date.strftime((kwargs['temporal'])["string_format"]))
+
+            property_names.append(temporal_properties['temporal_property'])
+
+        return cql_filter, property_names
+
+    def _mount_filters(self, geom, **kwargs):
+        """Mount the GetFeature filters of the temporal properties of a trajectory request.
+
+        The temporal properties (a property or a list of them) that share the same CQL filter are
+        retrieved with a single request, with the union of their property names.
+
+        Args:
+            geom (shapely.geometry.base.BaseGeometry): The geometry used in the spatial filter.
+            **kwargs: The trajectory keyword arguments.
+
+        Returns:
+            list: The filters, each one with the list of the temporal properties it retrieves.
+        """
+        temporal_properties = kwargs.pop('temporal_properties')
+
+        if isinstance(temporal_properties, dict):
+            temporal_properties = [temporal_properties]
+
+        groups = dict()
+
+        for properties in temporal_properties:
+            cql_filter, property_names = self._mount_query(geom, properties, **kwargs)
+
+            names, group = groups.setdefault(cql_filter, (list(), list()))
+            names.extend(name for name in property_names if name not in names)
+            group.append(properties)
+
+        if kwargs['geometry_flag']:
+            for names, _ in groups.values():
+                names.append(kwargs['geom_property']['property_name'])
+
+        return [
+            (f"{cql_filter}&propertyName={','.join(names)}", group)
+            for cql_filter, (names, group) in groups.items()
+        ]
+
+    def _organize_features(self, features, srid, **kwargs):
+        """Organize the trajectory observations of the given features, for each temporal property.
+
+        When the geometry is requested, the geometries of all the features are reprojected together
+        (once for all the temporal properties) from ``srid`` (the EPSG code of the features geometries).
+        """
+        geoms = [None] * len(features)
+
+        if kwargs['geometry_flag']:
+            geoms = self._transform_geometries(srid, [feature['geometry'] for feature in features])
+
+        temporal_properties = kwargs['temporal_properties']
+
+        if isinstance(temporal_properties, dict):
+            temporal_properties = [temporal_properties]
+
+        return [
+            self.organize_trajectory(result=feature, obs=properties,
+                                     geom_flag=kwargs['geometry_flag'],
+                                     geom_property=srid,
+                                     classification_class=kwargs['classification_class'],
+                                     temporal=kwargs['temporal'],
+                                     language=kwargs['language'],
+                                     geom=geom)
+            for properties in temporal_properties
+            for feature, geom in zip(features, geoms)
+        ]
+
     def get_trajectory(self, **kwargs):
-        """Return a trajectory observation of this datasource."""
+        """Return a trajectory observation of this datasource.
+
+        ``temporal_properties`` may be a list with the temporal properties of the layer: the properties
+        that share the same filter are retrieved with a single GetFeature request.
+        """
         invalid_parameters = set(kwargs) - {
             "temporal",
             "x", "y",
@@ -310,55 +507,88 @@ class WFSDataSource(DataSource):
 
         type_name =  kwargs['workspace'] + ":" + kwargs['feature_name']
 
-        geom = Point(kwargs['x'], kwargs['y'])
+        result = None
 
-        property_filter = f"&propertyName={kwargs['temporal_properties']['class_property']}"
+        for cql_filter, temporal_properties in self._mount_filters(Point(kwargs['x'], kwargs['y']), **kwargs):
+            retval, srid = self._get_feature(type_name=type_name, srid=(kwargs['geom_property'])['srid'],
+                                             filter=cql_filter)
 
-        cql_filter = "&CQL_FILTER=INTERSECTS({}, {})".format((kwargs['geom_property'])['property_name'], geom.wkt)
+            if retval is None:
+                continue
 
-        if (kwargs['temporal'])["type"] == "STRING":
-            temporal_observation = get_date_from_str((kwargs['temporal_properties'])['temporal_property']).strftime(
-                (kwargs['temporal'])["string_format"])
-            if kwargs['start_date']:
-                start_date = get_date_from_str(kwargs['start_date']).strftime((kwargs['temporal'])["string_format"])
-                if start_date > temporal_observation:
-                    return
-            if kwargs['end_date']:
-                end_date = get_date_from_str(kwargs['end_date']).strftime((kwargs['temporal'])["string_format"])
-                if temporal_observation > end_date:
-                    return
-        else:
-            if kwargs['start_date']:
-                start_date = get_date_from_str(kwargs['start_date'])
-                cql_filter += " AND {} >= {}".format((kwargs['temporal_properties'])["temporal_property"],
-                                                     start_date.strftime((kwargs['temporal'])["string_format"]))
+            result = (result or list()) + self._organize_features(
+                retval, srid, **dict(kwargs, temporal_properties=temporal_properties))
 
-            if kwargs['end_date']:
-                end_date = get_date_from_str(kwargs['end_date'])
-                cql_filter += " AND {} <= {}".format((kwargs['temporal_properties'])["temporal_property"],
-                                                     end_date.strftime((kwargs['temporal'])["string_format"]))
+        return result
 
-            property_filter += f",{kwargs['temporal_properties']['temporal_property']}"
+    def get_trajectories(self, points, **kwargs):
+        """Return the trajectory observations of this datasource for a set of locations.
 
-        if kwargs['geometry_flag']:
-            property_filter += f",{kwargs['geom_property']['property_name']}"
+        The locations are split in groups of ``batch_size`` points and each group is
+        queried with a single GetFeature request, filtered by the ``MultiPoint`` of the group.
+        The returned features are assigned back to the locations they intersect.
+
+        Args:
+            points (list): A list of (longitude, latitude) tuples according to EPSG:4326.
+            **kwargs: The trajectory keyword arguments, without ``x`` and ``y``.
+
+        Returns:
+            list: A list with the observations of each location, in the order of ``points``.
+        """
+        invalid_parameters = set(kwargs) - {
+            "temporal",
+            "geom_property",
+            "feature_name",
+            "workspace",
+            "temporal_properties",
+            "classification_class",
+            "start_date",
+            "end_date",
+            "geometry_flag",
+            "language",
+        }
+
+        if invalid_parameters:
+            raise AttributeError('invalid parameter(s): {}'.format(invalid_parameters))
+
+        type_name = kwargs['workspace'] + ":" + kwargs['feature_name']
+        geom_name = kwargs['geom_property']['property_name']
+
+        trajectories = [list() for _ in points]
+
+        for offset in range(0, len(points), self._batch_size):
+            group = points[offset:offset + self._batch_size]
+
+            for cql_filter, temporal_properties in self._mount_filters(MultiPoint(group), **kwargs):
+                # The geometry is always required to assign each feature to its locations
+                if not kwargs['geometry_flag']:
+                    cql_filter += f",{geom_name}"
+
+                retval, srid = self._get_feature(type_name=type_name, srid=kwargs['geom_property']['srid'],
+                                                 filter=cql_filter)
+
+                if retval is None:
+                    continue
+
+                matches = []
+
+                for feature in retval:
+                    feature_geom = prep(shape(feature['geometry']))
 
-        cql_filter = cql_filter + property_filter
+                    indexes = [offset + i for i, point in enumerate(group) if feature_geom.intersects(Point(point))]
 
-        retval = self._wfs.get_feature(type_name=type_name, srid=(kwargs['geom_property'])['srid'], filter=cql_filter)
+                    if indexes:
+                        matches.append((feature, indexes))
 
-        trj = list()
+                if not matches:
+                    continue
 
-        if retval is not None:
-            for i in retval:
-                trj.append(self.organize_trajectory(result=i, obs=kwargs['temporal_properties'],
-                                                    geom_flag=kwargs['geometry_flag'],
-                                                    geom_property=(kwargs['geom_property'])['srid'],
-                                                    classification_class=kwargs['classification_class'],
-                                                    temporal=kwargs['temporal'],
-                                                    language=kwargs['language'])
-                        )
+                trjs = self._organize_features([feature for feature, _ in matches], srid,
+                                               **dict(kwargs, temporal_properties=temporal_properties))
 
-            return trj
+                # The observations are organized by temporal property, then by feature
+                for position, trj in enumerate(trjs):
+                    for index in matches[position % len(matches)][1]:
+                        trajectories[index].append(dict(trj))
 
-        return retval
+        return trajectories
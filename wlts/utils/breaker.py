@@ -0,0 +1,102 @@
+#
+# This file is part of WLTS.
+# Copyright (C) 2022 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+"""Circuit breaker for the services used by Web Land Trajectory Service."""
+import time
+from threading import Lock
+from typing import Optional
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker:
+    """Stop calling a service after repeated failures.
+
+    The circuit is ``closed`` while the service is healthy. After ``failure_threshold``
+    consecutive failures it opens, and the calls fail fast (``allow`` returns ``False``) for
+    ``reset_timeout`` seconds. Then it becomes ``half-open``: a single probe call is allowed,
+    which closes the circuit when it succeeds or opens it again when it fails.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        """Create a closed circuit.
+
+        Args:
+            failure_threshold (int): Number of consecutive failures that opens the circuit. Default: 5.
+            reset_timeout (float): Time, in seconds, the circuit stays open before a probe. Default: 30.
+        """
+        self._threshold = max(1, int(failure_threshold))
+        self._reset_timeout = float(reset_timeout)
+
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = Lock()
+
+    @property
+    def state(self) -> str:
+        """Return the state of the circuit: ``closed``, ``open`` or ``half-open``."""
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self._reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Return whether a call may be issued to the service."""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self._reset_timeout:
+                    return False
+                self._state = HALF_OPEN
+
+            # Half-open: a single probe at a time
+            if self._probing:
+                return False
+
+            self._probing = True
+            return True
+
+    def record(self, failed: Optional[bool]) -> None:
+        """Record the outcome of an allowed call.
+
+        Args:
+            failed (bool): Whether the call failed. None when the outcome says nothing about the
+                service (e.g. the call was abandoned by its caller): a probe may then be tried again.
+        """
+        with self._lock:
+            if failed is None:
+                self._probing = False
+                return
+
+            if not failed:
+                self._state = CLOSED
+                self._failures = 0
+                self._probing = False
+                return
+
+            self._failures += 1
+
+            if self._state == HALF_OPEN or self._failures >= self._threshold:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
@@ -0,0 +1,300 @@
+#
+# This file is part of WLTS.
+# Copyright (C) 2022 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+"""Caches of Web Land Trajectory Service."""
+import hashlib
+import os
+import pickle
+import sqlite3
+import stat
+import sys
+import time
+from collections import OrderedDict
+from threading import Lock, local
+
+from wlts.config import Config
+
+
+def create_cache(namespace: str, max_bytes: int, ttl: float = None):
+    """Create a cache using the backend defined by ``WLTS_CACHE_BACKEND``.
+
+    Args:
+        namespace (str): The cache identifier, it must be the same in all the worker processes.
+        max_bytes (int): The maximum size, in bytes, of the cached values.
+        ttl (float, optional): The time to live, in seconds, of a value.
+
+    Returns:
+        LRUCache or SQLiteCache: The cache.
+    """
+    if Config.WLTS_CACHE_BACKEND == 'sqlite':
+        return SQLiteCache(os.path.join(Config.WLTS_CACHE_DIR, 'wlts-cache.sqlite'), namespace, max_bytes, ttl)
+
+    if Config.WLTS_CACHE_BACKEND != 'memory':
+        raise ValueError(f'Invalid cache backend {Config.WLTS_CACHE_BACKEND}')
+
+    return LRUCache(max_bytes, ttl)
+
+
+def _private_directory(path: str) -> None:
+    """Create the directory of a cache database, accessible only by the user of the service.
+
+    The cached values are unpickled, so a database planted by another user would run code in the service.
+
+    Raises:
+        PermissionError: When the directory (or the database) is owned by another user, or writable by others.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+
+    info = os.stat(path)
+
+    if info.st_uid != os.getuid() or info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(f'The cache directory {path} must be owned by the user of the service '
+                              'and not writable by others')
+
+    for name in os.listdir(path):
+        if os.stat(os.path.join(path, name)).st_uid != os.getuid():
+            raise PermissionError(f'The cache file {os.path.join(path, name)} is owned by another user')
+
+
+def size_of(value) -> int:
+    """Return the approximated size, in bytes, of a cached value.
+
+    The nested values (e.g. the GeoJSON features) are sized by their serialized length,
+    since ``sys.getsizeof`` only counts the outer container.
+    """
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    if isinstance(value, (bytes, bytearray, str)):
+        return sys.getsizeof(value)
+    if isinstance(value, tuple):
+        return sum(size_of(v) for v in value)
+    return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class LRUCache:
+    """Thread-safe in memory cache, bounded by the size of its values.
+
+    The least recently used values are evicted when the cache exceeds ``max_bytes``,
+    and a value expires ``ttl`` seconds after being stored.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float = None):
+        """Create a LRUCache.
+
+        Args:
+            max_bytes (int): The maximum size, in bytes, of the cached values.
+            ttl (float, optional): The time to live, in seconds, of a value. Default: values do not expire.
+        """
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        """Return the value of a key, or default when the key is not cached or expired."""
+        with self._lock:
+            item = self._items.get(key)
+
+            if item is None:
+                return default
+
+            value, size, expires = item
+
+            if expires is not None and expires < time.monotonic():
+                self._pop(key)
+                return default
+
+            self._items.move_to_end(key)
+
+            return value
+
+    def set(self, key, value) -> None:
+        """Store the value of a key, evicting the least recently used values if needed."""
+        size = size_of(value)
+
+        if size > self._max_bytes:
+            return
+
+        expires = time.monotonic() + self._ttl if self._ttl else None
+
+        with self._lock:
+            if key in self._items:
+                self._pop(key)
+
+            self._items[key] = (value, size, expires)
+            self._size += size
+
+            while self._size > self._max_bytes:
+                self._pop(next(iter(self._items)))
+
+    def clear(self) -> None:
+        """Remove all the cached values."""
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+
+    def _pop(self, key) -> None:
+        """Remove a key from the cache."""
+        _, size, _ = self._items.pop(key)
+        self._size -= size
+
+    def __len__(self) -> int:
+        """Return the number of cached values."""
+        return len(self._items)
+
+
+class SQLiteCache:
+    """Cache stored in a SQLite database, shared by all the worker processes of a host.
+
+    The values are pickled, the least recently used values of a namespace are evicted when it
+    exceeds ``max_bytes``, and a value expires ``ttl`` seconds after being stored. Database errors
+    are handled as cache misses, so the cache never fails a request.
+
+    The reads do not write the database: the access times of a process are recorded in batch before
+    its evictions, so the least recently used order is approximated. The database directory must be
+    private to the user of the service (see ``_private_directory``).
+    """
+
+    _EVICTION_INTERVAL = 64
+
+    def __init__(self, path: str, namespace: str, max_bytes: int, ttl: float = None):
+        """Create a SQLiteCache.
+
+        Args:
+            path (str): The database file path.
+            namespace (str): The cache identifier inside the database.
+            max_bytes (int): The maximum size, in bytes, of the cached values of the namespace.
+            ttl (float, optional): The time to live, in seconds, of a value. Default: values do not expire.
+        """
+        self._path = path
+        self._namespace = namespace
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._local = local()
+        self._writes = 0
+        self._accessed = dict()
+        self._lock = Lock()
+
+        _private_directory(os.path.dirname(path))
+
+        with self._connection() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS cache ('
+                         'namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, size INTEGER NOT NULL, '
+                         'expires REAL, accessed REAL NOT NULL, PRIMARY KEY (namespace, key))')
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return the database connection of the current thread and process."""
+        conn = getattr(self._local, 'conn', None)
+
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self._path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+
+        return conn
+
+    @staticmethod
+    def _key(key) -> str:
+        """Return the database key of a cache key."""
+        return hashlib.sha1(pickle.dumps(key)).hexdigest()
+
+    def get(self, key, default=None):
+        """Return the value of a key, or default when the key is not cached or expired."""
+        try:
+            conn = self._connection()
+            row = conn.execute('SELECT value, expires FROM cache WHERE namespace = ? AND key = ?',
+                               (self._namespace, self._key(key))).fetchone()
+
+            if row is None:
+                return default
+
+            value, expires = row
+            now = time.time()
+
+            if expires is not None and expires < now:
+                conn.execute('DELETE FROM cache WHERE namespace = ? AND key = ?', (self._namespace, self._key(key)))
+                return default
+
+            # The access is recorded in the database by the next eviction, so a read takes no write lock
+            with self._lock:
+                self._accessed[self._key(key)] = now
+
+            return pickle.loads(value)
+        except sqlite3.Error:
+            return default
+
+    def set(self, key, value) -> None:
+        """Store the value of a key, evicting the least recently used values of the namespace if needed."""
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+        if len(data) > self._max_bytes:
+            return
+
+        now = time.time()
+        expires = now + self._ttl if self._ttl else None
+
+        try:
+            conn = self._connection()
+            conn.execute('INSERT OR REPLACE INTO cache (namespace, key, value, size, expires, accessed) '
+                         'VALUES (?, ?, ?, ?, ?, ?)',
+                         (self._namespace, self._key(key), sqlite3.Binary(data), len(data), expires, now))
+
+            self._writes += 1
+
+            if self._writes % self._EVICTION_INTERVAL == 0:
+                self._evict(conn)
+        except sqlite3.Error:
+            return
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """Remove the expired values and the least recently used values above the size limit."""
+        with self._lock:
+            accessed, self._accessed = self._accessed, dict()
+
+        conn.executemany('UPDATE cache SET accessed = ? WHERE namespace = ? AND key = ?',
+                         [(at, self._namespace, key) for key, at in accessed.items()])
+
+        conn.execute('DELETE FROM cache WHERE namespace = ? AND expires < ?', (self._namespace, time.time()))
+
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM cache WHERE namespace = ?',
+                             (self._namespace,)).fetchone()[0]
+
+        if total <= self._max_bytes:
+            return
+
+        rows = conn.execute('SELECT key, size FROM cache WHERE namespace = ? ORDER BY accessed',
+                            (self._namespace,))
+
+        keys = list()
+
+        for key, size in rows:
+            if total <= self._max_bytes:
+                break
+            keys.append((self._namespace, key))
+            total -= size
+
+        conn.executemany('DELETE FROM cache WHERE namespace = ? AND key = ?', keys)
+
+    def clear(self) -> None:
+        """Remove all the cached values of the namespace."""
+        try:
+            self._connection().execute('DELETE FROM cache WHERE namespace = ?', (self._namespace,))
+        except sqlite3.Error:
+            return
@@ -0,0 +1,73 @@
+#
+# This file is part of WLTS.
+# Copyright (C) 2022 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+"""Deadlines of the requests of Web Land Trajectory Service."""
+import time
+from functools import wraps
+from threading import local
+from typing import Callable, Optional
+
+_local = local()
+
+
+def current() -> Optional[float]:
+    """Return the deadline (a ``time.monotonic()`` value) of the calls of the current thread, if any."""
+    return getattr(_local, 'deadline', None)
+
+
+def remaining() -> Optional[float]:
+    """Return the time, in seconds, left until the deadline of the current thread, or None without deadline."""
+    deadline = current()
+
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def run(deadline: Optional[float], fn: Callable, *args, **kwargs):
+    """Call ``fn(*args, **kwargs)`` with a deadline for the current thread.
+
+    The HTTP requests issued by the call are bounded by the deadline (see ``HTTPClient._request``).
+    A nested deadline never extends the current one.
+
+    Args:
+        deadline (float): The deadline, as a ``time.monotonic()`` value, or None to keep the current one.
+        fn (Callable): The function to call.
+    """
+    previous = current()
+
+    if deadline is not None and previous is not None:
+        deadline = min(deadline, previous)
+
+    _local.deadline = deadline if deadline is not None else previous
+
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _local.deadline = previous
+
+
+def bind(fn: Callable) -> Callable:
+    """Return a function that calls ``fn`` with the deadline of the current thread.
+
+    It carries the deadline to the tasks submitted to another worker pool.
+    """
+    deadline = current()
+
+    @wraps(fn)
+    def _wrapper(*args, **kwargs):
+        return run(deadline, fn, *args, **kwargs)
+
+    return _wrapper
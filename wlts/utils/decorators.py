@@ -26,24 +26,23 @@ from werkzeug.exceptions import BadRequest
 
 
 def require_model(schema, draft=draft7_format_checker):
-    """Require a JSON schema object to validate request query arguments.
+    """Require a JSON schema object to validate request query arguments or POST data values.
 
     You can use it with APIResource in order to format BadRequestError output.
 
-    TODO: Improve decorator to support request POST data values
-
     Args:
         schema (dict): JSON schema with Python Dictionaries.
         draft (jsonschema.FormatChecker, optional): JSON Schema format.
 
     Raises:
-        BadRequest: When request arguments do not match with JSON schema.
+        BadRequest: When request arguments or data do not match with JSON schema.
     """
     def decorator(fn):
         @wraps(fn)
         def decorated_function(*args, **kwargs):
+            instance = request.get_json(silent=True) if request.method == 'POST' else request.args
             try:
-                validate(instance=request.args,
+                validate(instance=instance,
                          schema=schema,
                          format_checker=draft)
             except (SchemaError, ValidationError) as e:
@@ -0,0 +1,44 @@
+#
+# This file is part of WLTS.
+# Copyright (C) 2022 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+"""Shared worker pools for Web Land Trajectory Service."""
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+_executors = dict()
+
+_lock = Lock()
+
+
+def get_executor(name: str, max_workers: int) -> ThreadPoolExecutor:
+    """Return the shared thread pool identified by name, creating it on first use.
+
+    Each stage of the trajectory pipeline uses its own pool, so a task never waits
+    for work queued behind it in the same pool.
+
+    Args:
+        name (str): The pool identifier.
+        max_workers (int): The maximum number of threads of the pool.
+
+    Returns:
+        ThreadPoolExecutor: The worker pool.
+    """
+    with _lock:
+        if name not in _executors:
+            _executors[name] = ThreadPoolExecutor(max_workers=max(1, int(max_workers)),
+                                                  thread_name_prefix=f'wlts-{name}')
+        return _executors[name]
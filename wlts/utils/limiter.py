@@ -0,0 +1,146 @@
+#
+# This file is part of WLTS.
+# Copyright (C) 2022 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+"""Adaptive concurrency limits for Web Land Trajectory Service."""
+import time
+from collections import deque
+from threading import Event, Lock
+from typing import Optional
+
+_WARMUP_SAMPLES = 20
+"""Number of calls observed before the latency is taken into account."""
+
+
+class AdaptiveLimiter:
+    """Limit the number of concurrent calls to a service, adapting the limit to its health.
+
+    The limit follows an AIMD (additive increase, multiplicative decrease) policy: each
+    successful call increases it by ``1 / limit`` (one slot per round), up to ``max_concurrency``,
+    while a failed or slow call halves it, down to ``min_concurrency``. A call is slow when the
+    short-term moving average of the latencies is ``latency_tolerance`` times the baseline (a
+    long-term moving average), so the limit only reacts to a rising latency.
+
+    The calls waiting for a slot are served in arrival order, so no caller is starved.
+    """
+
+    def __init__(self, max_concurrency: int = 16, min_concurrency: int = 1, latency_tolerance: float = 2.0):
+        """Create a limiter.
+
+        Args:
+            max_concurrency (int): The maximum number of concurrent calls. Default: 16.
+            min_concurrency (int): The minimum number of concurrent calls. Default: 1.
+            latency_tolerance (float): How many times the baseline latency the average latency may reach
+                before the limit is decreased. Default: 2.0.
+        """
+        self._max = max(1, int(max_concurrency))
+        self._min = max(1, min(int(min_concurrency), self._max))
+        self._tolerance = float(latency_tolerance)
+
+        self._limit = float(self._max)
+        self._in_flight = 0
+        self._waiters = deque()
+        self._lock = Lock()
+
+        self._baseline = None
+        self._latency = None
+        self._samples = 0
+        self._decreased_at = 0.0
+
+    @property
+    def limit(self) -> int:
+        """Return the current number of concurrent calls allowed."""
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        """Return the number of calls holding a slot."""
+        return self._in_flight
+
+    def acquire(self, timeout: float = None) -> bool:
+        """Wait for a slot.
+
+        Args:
+            timeout (float, optional): The maximum time, in seconds, to wait.
+
+        Returns:
+            bool: Whether the slot was acquired (``False`` when the timeout expired).
+        """
+        with self._lock:
+            if not self._waiters and self._in_flight < int(self._limit):
+                self._in_flight += 1
+                return True
+
+            event = Event()
+            self._waiters.append(event)
+
+        if event.wait(timeout):
+            return True
+
+        with self._lock:
+            # The slot may have been handed over right after the timeout expired
+            if event.is_set():
+                return True
+
+            self._waiters.remove(event)
+            return False
+
+    def release(self, started_at: float, failed: Optional[bool] = False) -> None:
+        """Release a slot and update the limit with the outcome of the call.
+
+        Args:
+            started_at (float): The ``time.monotonic()`` when the call started.
+            failed (bool): Whether the call failed (e.g. server error or timeout). None when the
+                outcome says nothing about the service (e.g. the call was abandoned by its caller).
+        """
+        now = time.monotonic()
+        latency = now - started_at
+
+        with self._lock:
+            self._in_flight -= 1
+
+            if failed is None:
+                self._wake()
+                return
+
+            if not failed:
+                if self._samples == 0:
+                    self._baseline = self._latency = latency
+                else:
+                    self._baseline += (latency - self._baseline) * 0.01
+                    self._latency += (latency - self._latency) * 0.2
+                self._samples += 1
+
+            # The latency is only judged once the baseline has enough samples
+            slow = not failed and self._samples >= _WARMUP_SAMPLES and \
+                self._latency > self._baseline * self._tolerance
+
+            if failed or slow:
+                # Decrease once per round: only the calls started after the last decrease count
+                if started_at >= self._decreased_at:
+                    self._limit = max(float(self._min), self._limit / 2)
+                    self._decreased_at = now
+                    self._latency = self._baseline
+            else:
+                self._limit = min(float(self._max), self._limit + 1 / self._limit)
+
+            self._wake()
+
+    def _wake(self) -> None:
+        """Hand the free slots over to the waiting calls, in arrival order. The lock must be held."""
+        while self._waiters and self._in_flight < int(self._limit):
+            self._in_flight += 1
+            self._waiters.popleft().set()
@@ -42,3 +42,5 @@ describe_collection = load_schema('describe_collection_request.json')
 describe_collection_response = load_schema('describe_collection_response.json')
 trajectory = load_schema('trajectory_request.json')
 trajectory_response = load_schema('trajectory_response.json')
+trajectories = load_schema('trajectories_request.json')
+trajectories_response = load_schema('trajectories_response.json')
@@ -0,0 +1,74 @@
+#
+# This file is part of WLTS.
+# Copyright (C) 2022 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+"""Coalescing of identical concurrent calls for Web Land Trajectory Service."""
+from concurrent.futures import Future
+from threading import Lock
+from typing import Callable, Hashable
+
+
+class SingleFlight:
+    """Run a call at most once at a time for each key.
+
+    While a call is in flight, the identical calls (with the same key) do not run: they
+    wait for it and share its result, or its exception. Once it finishes the key is
+    released, so the next call runs again (caching the results is up to the caller).
+    """
+
+    def __init__(self):
+        """Create an empty group of calls."""
+        self._calls = dict()
+        self._lock = Lock()
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs):
+        """Run ``fn(*args, **kwargs)``, unless an identical call is in flight.
+
+        Args:
+            key (Hashable): The identifier of the call.
+            fn (Callable): The function to call.
+            *args: The positional arguments of the function.
+            **kwargs: The keyword arguments of the function.
+
+        Returns:
+            The result of the call in flight.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+        return result
+
+    def __len__(self) -> int:
+        """Return the number of calls in flight."""
+        return len(self._calls)
@@ -16,12 +16,18 @@
 # along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
 #
 """Utils for Web Land Trajectory Service."""
+import threading
 from datetime import datetime
+from functools import lru_cache
+from xml.etree import ElementTree
 
+import numpy
 import pyproj
 from shapely.geometry.base import BaseGeometry
 from shapely.ops import transform
 
+_transformers = threading.local()
+
 
 def get_date_from_str(date, date_ref=None):
     """Utility to build date from str."""
@@ -41,6 +47,68 @@ def get_date_from_str(date, date_ref=None):
     return date
 
 
+def iter_xml_elements(source, names: dict):
+    """Parse a XML document incrementally and yield the text of the elements with the given names.
+
+    The elements are matched by their local name, without namespace. Every element is discarded
+    as soon as it is parsed, so the whole document is never kept in memory.
+
+    Args:
+        source: A file-like object with the XML document.
+        names (dict): The local names of the wanted elements, mapped to the local name of an ancestor
+            they must have (or None for any).
+    Yields:
+        tuple: The local name and the text of each wanted element, in document order.
+    """
+    stack = []
+
+    for event, element in ElementTree.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            stack.append(element.tag.rsplit('}', 1)[-1])
+            continue
+
+        name = stack.pop()
+
+        if name in names and (names[name] is None or names[name] in stack):
+            yield name, element.text
+
+        element.clear()
+
+
+@lru_cache(maxsize=None)
+def _get_crs(crs: str) -> pyproj.CRS:
+    """Return the (process-wide) CRS object of the given definition."""
+    return pyproj.CRS(crs)
+
+
+def get_transformer(crs_src: str, crs_dest: str, always_xy: bool = False) -> pyproj.Transformer:
+    """Return a transformer between two CRS, reused through a registry keyed by (crs_src, crs_dest, always_xy).
+
+    The pyproj transformers are not thread-safe, so each thread keeps its own registry.
+
+    Args:
+        crs_src (str): Source CRS.
+        crs_dest (str): Destiny CRS.
+        always_xy (bool): Use the x/y (longitude/latitude) axis order for both CRS.
+    Returns:
+        pyproj.Transformer: The transformer.
+    """
+    registry = getattr(_transformers, 'registry', None)
+
+    if registry is None:
+        registry = _transformers.registry = dict()
+
+    key = (crs_src, crs_dest, always_xy)
+
+    transformer = registry.get(key)
+
+    if transformer is None:
+        transformer = pyproj.Transformer.from_crs(_get_crs(crs_src), _get_crs(crs_dest), always_xy=always_xy)
+        registry[key] = transformer
+
+    return transformer
+
+
 def transform_crs(crs_src: str, crs_dest: str, geom: BaseGeometry) -> BaseGeometry:
     """Reproject geometry.
     
@@ -51,9 +119,165 @@ def transform_crs(crs_src: str, crs_dest: str, geom: BaseGeometry) -> BaseGeomet
     Returns:
         shapely.geometry.base.BaseGeometry: Shapely Geometry reprojected.
     """
-    crs_src = pyproj.CRS(crs_src)
-    crs_dest = pyproj.CRS(crs_dest)
-    
-    transform_fnc = pyproj.Transformer.from_crs(crs_src, crs_dest).transform
-    
-    return transform(transform_fnc, geom)
+    transformer = get_transformer(crs_src, crs_dest)
+
+    return transform(transformer.transform, geom)
+
+
+def transform_coordinates(crs_src: str, crs_dest: str, xs, ys):
+    """Reproject coordinates given in x/y (longitude/latitude) order.
+
+    Args:
+        crs_src (str): Actual coordinates CRS.
+        crs_dest (str): Destiny coordinates CRS.
+        xs (list): The x coordinates.
+        ys (list): The y coordinates.
+    Returns:
+        tuple: The reprojected x and y coordinates.
+    """
+    transformer = get_transformer(crs_src, crs_dest, always_xy=True)
+
+    return transformer.transform(numpy.asarray(xs, dtype='float64'), numpy.asarray(ys, dtype='float64'))
+
+
+#: The depth of the coordinate arrays (a list of positions) of each GeoJSON geometry type
+#: and the minimum number of positions of a simplified array.
+_GEOJSON_ARRAYS = {
+    'Point': (-1, 1),
+    'MultiPoint': (0, 1),
+    'LineString': (0, 2),
+    'MultiLineString': (1, 2),
+    'Polygon': (1, 4),
+    'MultiPolygon': (2, 4),
+}
+
+
+def _geojson_arrays(coordinates, depth: int) -> list:
+    """Return the coordinate arrays (lists of positions) of a GeoJSON coordinates member."""
+    if depth <= 0:
+        return [coordinates]
+
+    return [array for item in coordinates for array in _geojson_arrays(item, depth - 1)]
+
+
+def _geojson_rebuild(coordinates, depth: int, arrays) -> list:
+    """Rebuild a GeoJSON coordinates member with the arrays given by the iterator ``arrays``."""
+    if depth <= 0:
+        return next(arrays)
+
+    return [_geojson_rebuild(item, depth - 1, arrays) for item in coordinates]
+
+
+def simplify_coordinates(coords: numpy.ndarray, tolerance: float) -> numpy.ndarray:
+    """Simplify a (N, 2) coordinate array with the Douglas-Peucker algorithm.
+
+    Args:
+        coords (numpy.ndarray): The coordinates.
+        tolerance (float): The maximum distance, in coordinate units, of a removed position to the simplified line.
+    Returns:
+        numpy.ndarray: The simplified coordinates. The first and the last positions are always kept.
+    """
+    size = len(coords)
+
+    if size < 3:
+        return coords
+
+    keep = numpy.zeros(size, dtype=bool)
+    keep[0] = keep[-1] = True
+
+    stack = [(0, size - 1)]
+
+    while stack:
+        start, end = stack.pop()
+
+        if end - start < 2:
+            continue
+
+        first, segment = coords[start], coords[end] - coords[start]
+        points = coords[start + 1:end] - first
+        length = numpy.hypot(segment[0], segment[1])
+
+        if length == 0:
+            distances = numpy.hypot(points[:, 0], points[:, 1])
+        else:
+            distances = numpy.abs(segment[0] * points[:, 1] - segment[1] * points[:, 0]) / length
+
+        index = int(numpy.argmax(distances))
+
+        if distances[index] > tolerance:
+            index += start + 1
+            keep[index] = True
+            stack.extend(((start, index), (index, end)))
+
+    return coords[keep]
+
+
+def transform_geojson(crs_src: str, crs_dest: str, geometries: list, precision: int = None,
+                      tolerance: float = None) -> list:
+    """Reproject a list of GeoJSON geometries, without building Shapely geometries.
+
+    The positions of all the geometries are reprojected together as a single contiguous NumPy array.
+
+    Args:
+        crs_src (str): Actual geometries CRS.
+        crs_dest (str): Destiny geometries CRS.
+        geometries (list): A list of GeoJSON geometries (dict).
+        precision (int, optional): The number of decimal places of the reprojected coordinates.
+        tolerance (float, optional): The Douglas-Peucker simplification tolerance, in units of ``crs_dest``.
+    Returns:
+        list: The GeoJSON geometries reprojected, in the same order.
+    Raises:
+        ValueError: When a geometry type is not supported.
+    """
+    arrays, depths = [], []
+
+    for geometry in geometries:
+        if geometry['type'] not in _GEOJSON_ARRAYS:
+            raise ValueError(f"Unsupported geometry type {geometry['type']}.")
+
+        depth, _ = _GEOJSON_ARRAYS[geometry['type']]
+        coordinates = [geometry['coordinates']] if depth < 0 else geometry['coordinates']
+
+        depths.append(depth)
+        arrays.extend(numpy.asarray(array, dtype='float64')[:, :2]
+                      for array in _geojson_arrays(coordinates, max(depth, 0)))
+
+    if not arrays:
+        return [dict(geometry) for geometry in geometries]
+
+    coords = numpy.concatenate(arrays)
+
+    xs, ys = get_transformer(crs_src, crs_dest).transform(coords[:, 0], coords[:, 1])
+
+    coords = numpy.column_stack((xs, ys))
+
+    offsets = numpy.cumsum([len(array) for array in arrays])[:-1]
+    arrays = iter(numpy.split(coords, offsets))
+
+    result = []
+
+    for geometry, depth in zip(geometries, depths):
+        _, min_size = _GEOJSON_ARRAYS[geometry['type']]
+
+        def _array():
+            array = next(arrays)
+
+            if tolerance and min_size > 1:
+                simplified = simplify_coordinates(array, tolerance)
+
+                if len(simplified) >= min_size:
+                    array = simplified
+
+            if precision is not None:
+                array = numpy.round(array, precision)
+
+            return array.tolist()
+
+        if depth < 0:
+            coordinates = _array()[0]
+        else:
+            coordinates = _geojson_rebuild(geometry['coordinates'], depth, iter(_array, None))
+
+        result.append(dict(type=geometry['type'], coordinates=coordinates))
+
+    return result
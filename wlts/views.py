@@ -17,19 +17,36 @@
 #
 """Views of Web Land Trajectory Service."""
 from bdc_auth_client.decorators import oauth2
-from flask import Blueprint, jsonify, request
+from flask import (Blueprint, Response, json, jsonify, request,
+                   stream_with_context)
 from lccs_db.config import Config as Config_db
 from lccs_db.utils import language
 
 from wlts.utils.schemas import (collections_list, describe_collection,
-                                trajectory)
+                                trajectories, trajectory)
 
 from .config import Config
-from .controller import WLTS, TrajectoryParams
+from .controller import WLTS, TrajectoriesParams, TrajectoryParams
 from .utils.decorators import require_model
 
 bp = Blueprint('wlts', import_name=__name__, url_prefix='/wlts')
 
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def _accept_ndjson() -> bool:
+    """Check if the client requested a streamed (NDJSON) response."""
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def _ndjson_response(records) -> Response:
+    """Stream the records as newline delimited JSON."""
+    def generate():
+        for record in records:
+            yield json.dumps(record) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
 
 @bp.route('/', methods=['GET'])
 def root():
@@ -79,11 +96,61 @@ def describe_collection(**kwargs):
 @require_model(trajectory)
 @oauth2(required=False)
 def trajectory(**kwargs):
-    """Retrieves collection metadata.
+    """Retrieves the trajectory of a location.
 
-    :returns: Collection Description
+    The observations are streamed as newline delimited JSON when the client accepts ``application/x-ndjson``,
+    collection by collection as each one finishes.
+    Otherwise the response carries an ``ETag`` and it is answered from the results cache when possible.
+
+    :returns: Trajectory
     :rtype: dict
     """
     params = TrajectoryParams(**request.args.to_dict())
 
-    return jsonify(WLTS.get_trajectory(params, roles=kwargs.get('roles', None)))
+    if _accept_ndjson():
+        response = _ndjson_response(WLTS.stream_trajectory(params, roles=kwargs.get('roles', None)))
+        response.vary.add('Accept')
+        return response
+
+    body, etag = WLTS.get_cached_trajectory(params, roles=kwargs.get('roles', None))
+
+    response = Response(body, mimetype='application/json')
+
+    # The same URL answers NDJSON to the clients that accept it
+    response.vary.add('Accept')
+
+    # The partial results are not tagged and must not be cached
+    if etag is None:
+        response.cache_control.no_store = True
+        return response
+
+    response.set_etag(etag)
+
+    # The responses that depend on the user roles must not be shared by the HTTP caches
+    if kwargs.get('roles'):
+        response.cache_control.private = True
+    else:
+        response.cache_control.public = True
+    response.cache_control.max_age = int(Config.WLTS_RESULT_CACHE_TTL)
+
+    return response.make_conditional(request)
+
+
+@bp.route('/trajectories', methods=['POST'])
+@require_model(trajectories)
+@oauth2(required=False)
+def trajectories(**kwargs):
+    """Retrieves the trajectories of a set of locations.
+
+    The trajectory of each location is streamed as newline delimited JSON when the client
+    accepts ``application/x-ndjson``.
+
+    :returns: Trajectories
+    :rtype: dict
+    """
+    params = TrajectoriesParams(**request.get_json())
+
+    if _accept_ndjson():
+        return _ndjson_response(WLTS.stream_trajectories(params, roles=kwargs.get('roles', None)))
+
+    return jsonify(WLTS.get_trajectories(params, roles=kwargs.get('roles', None)))